@@ -1,4 +1,4 @@
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, abort, jsonify, redirect, request, stream_with_context, url_for
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from config import Config
 from models import (
@@ -20,12 +20,37 @@ from models import (
     ClassSession,
     Booking,
     AccountMovement,
+    BalanceCheckpoint,
     Payment,
+    PRODUCTO_TSVECTOR,
+    DailyPaymentRollup,
+    DailyClassRollup,
+    RollupState,
+    ahora_bd,
 )
 from flask_migrate import Migrate
+import click
 from datetime import datetime, timedelta, date, time
 from flask_cors import CORS
-from decimal import Decimal
+from reference_cache import init_reference_caches
+from rollups import ROLLUP_NOMBRE, refrescar_rollups
+from autocomplete import init_autocomplete
+from compression import Compression
+from json_provider import FastJSONProvider
+from versioning import init_table_versions, versioned
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, buscar
+from instrumentation import RequestMetrics, check_database, pool_stats, prometheus_lines
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from sqlalchemy import Numeric, case, func, insert, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
+import base64
+import binascii
+import csv
+import hashlib
+import io
+import itertools
+import json
 
 
 
@@ -35,6 +60,8 @@ migrate = Migrate()
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    # Serializa Decimal/fechas directamente (orjson si está instalado)
+    app.json = FastJSONProvider(app)
 
     # Habilitar CORS para el front (localhost:5173)
     CORS(app, resources={r"/*": {"origins": "*"}})
@@ -44,143 +71,291 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Tablas de referencia pequeñas que casi no cambian: se resuelven
+    # id <-> nombre desde memoria en vez de consultar en cada request.
+    reference_caches = init_reference_caches(
+        app, (Tienda, MarcaProducto, CategoriaProducto, Talla)
+    )
+
+    # Catálogos que las tablets consultan seguido: se versionan por tabla
+    # para responder 304 sin leer las filas (ver @versioned)
+    init_table_versions(
+        app,
+        (Producto, Tienda, MarcaProducto, CategoriaProducto, Talla, MembershipPlan, Coach),
+    )
+
+    # Autocomplete de clientes por prefijo, servido desde memoria
+    autocomplete = init_autocomplete(app, {
+        Cliente: dict(campos=("nombre", "nit"), telefonos=("telefono",), extra=("email",)),
+        Client: dict(campos=("nombre", "email"), telefonos=("telefono",)),
+    })
+
+    # Tiempo, queries SQL y tiempo en SQL por endpoint (ver /metrics)
+    request_metrics = RequestMetrics(app)
+
+    # gzip/brotli según Accept-Encoding
+    Compression(app)
+
     @app.route("/")
     def index():
         return jsonify({"message": "API funcionando"})
 
+    @app.route("/health", methods=["GET"])
+    def health():
+        """
+        Estado de la API y de la BD: latencia de SELECT 1 y uso del pool.
+        Responde 503 si la BD no contesta (para el balanceador/orquestador).
+        """
+        ok, latency_ms, error = check_database(db.engine)
+        data = {
+            "status": "ok" if ok else "error",
+            "db": {
+                "ok": ok,
+                "latency_ms": round(latency_ms, 2),
+                "pool": pool_stats(db.engine),
+            },
+        }
+        if error:
+            data["db"]["error"] = error
+        return jsonify(data), 200 if ok else 503
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """Métricas en formato de texto de Prometheus."""
+        ok, latency_ms, _ = check_database(db.engine)
+        stats = pool_stats(db.engine)
+        lines = []
+        lines += prometheus_lines("db_up", "gauge", "1 si la BD responde a SELECT 1.", [({}, int(ok))])
+        lines += prometheus_lines(
+            "db_ping_latency_seconds", "gauge", "Latencia de SELECT 1.", [({}, latency_ms / 1000)]
+        )
+        for nombre, ayuda in (
+            ("size", "Tamaño configurado del pool."),
+            ("checkedout", "Conexiones en uso."),
+            ("checkedin", "Conexiones libres en el pool."),
+            ("overflow", "Conexiones abiertas por encima de pool_size."),
+        ):
+            if nombre in stats:
+                lines += prometheus_lines(f"db_pool_{nombre}", "gauge", ayuda, [({}, stats[nombre])])
+        lines += request_metrics.lines()
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
     # ---------- CRUD PRODUCTOS ----------
 
-    @app.route("/productos", methods=["GET"])
-    def listar_productos():
-        productos = Producto.query.all()
-        data = []
-        for p in productos:
-            data.append({
-                "id": p.id,
-                "sku": p.sku,
+    def producto_imagen_url(p):
+        if not p.imagen_hash:
+            return None
+        # La URL lleva el hash, así que puede cachearse indefinidamente
+        return url_for("obtener_imagen_producto", producto_id=p.id, v=p.imagen_hash)
+
+    # Columnas que usa producto_to_dict (sin la imagen): los listados las
+    # seleccionan como filas Row en vez de hidratar instancias Producto
+    PRODUCTO_COLUMNAS = (
+        Producto.id,
+        Producto.sku,
+        Producto.tienda_id,
+        Producto.marca_id,
+        Producto.descripcion,
+        Producto.categoria_id,
+        Producto.talla_id,
+        Producto.costo,
+        Producto.precio,
+        Producto.cantidad,
+        Producto.imagen_hash,
+    )
+
+    def producto_to_dict(p, include_imagen=False):
+        """p puede ser un Producto o una fila de PRODUCTO_COLUMNAS."""
+        data = {
+            "id": p.id,
+            "sku": p.sku,
+
+            # Tienda
+            "tienda": reference_caches[Tienda].get_nombre(p.tienda_id),
+            "tienda_id": p.tienda_id,
 
-                # Tienda
-                "tienda": p.tienda.nombre if p.tienda else None,
-                "tienda_id": p.tienda.id if p.tienda else None,
+            # Marca
+            "marca": reference_caches[MarcaProducto].get_nombre(p.marca_id),
+            "marca_id": p.marca_id,
 
-                # Marca
-                "marca": p.marca.nombre if p.marca else None,
-                "marca_id": p.marca.id if p.marca else None,
+            "descripcion": p.descripcion,
 
-                "descripcion": p.descripcion,
+            # Categoría
+            "categoria": reference_caches[CategoriaProducto].get_nombre(p.categoria_id),
+            "categoria_id": p.categoria_id,
 
-                # Categoría
-                "categoria": p.categoria.nombre if p.categoria else None,
-                "categoria_id": p.categoria.id if p.categoria else None,
+            # Talla
+            "talla": reference_caches[Talla].get_nombre(p.talla_id),
+            "talla_id": p.talla_id,
 
-                # Talla
-                "talla": p.talla.nombre if p.talla else None,
-                "talla_id": p.talla.id if p.talla else None,
+            "costo": p.costo,
+            "precio": p.precio,
+            "cantidad": p.cantidad,
+            "imagen_url": producto_imagen_url(p),
+            "imagen_hash": p.imagen_hash,
+        }
+        if include_imagen:
+            data["imagen"] = p.imagen
+        return data
 
-                "costo": float(p.costo),
-                "precio": float(p.precio),
-                "cantidad": p.cantidad,
-                "imagen": p.imagen,
-            })
-        return jsonify(data)
+    @app.route("/productos", methods=["GET"])
+    @versioned(Producto, Tienda, MarcaProducto, CategoriaProducto, Talla)
+    def listar_productos():
+        """
+        Lista productos.
+        Opcional: ?limit=N&after=<cursor> para paginar por id.
+
+        No incluye la imagen; cada producto trae imagen_url/imagen_hash
+        y la imagen se pide aparte en /productos/<id>/imagen.
+        """
+        query = db.session.query(*PRODUCTO_COLUMNAS)
+        return keyset_response(query, Producto.id, producto_to_dict)
+
+    def leer_busqueda():
+        """Lee ?q= y ?limit= de una búsqueda; q vacío -> None."""
+        q = (request.args.get("q") or "").strip()
+        limite = request.args.get("limit", DEFAULT_SEARCH_LIMIT, type=int)
+        return q or None, max(1, min(limite, MAX_SEARCH_LIMIT))
+
+    @app.route("/productos/buscar", methods=["GET"])
+    def buscar_productos():
+        """
+        Busca productos por SKU o descripción, ordenados por relevancia.
+        Query params: q (obligatorio), limit (default 20, máx. 100).
+        """
+        q, limite = leer_busqueda()
+        if not q:
+            return jsonify({"error": "q es obligatorio"}), 400
+        productos = buscar(
+            db.session.query(*PRODUCTO_COLUMNAS),
+            q,
+            (Producto.sku, Producto.descripcion),
+            limite,
+            Producto.id,
+            tsvector=PRODUCTO_TSVECTOR,
+        )
+        return jsonify([producto_to_dict(p) for p in productos])
 
 
     @app.route("/productos/<int:producto_id>", methods=["GET"])
     def obtener_producto(producto_id):
         p = Producto.query.get_or_404(producto_id)
-        return jsonify({
-            "id": p.id,
-            "sku": p.sku,
+        return jsonify(producto_to_dict(p, include_imagen=True))
 
-            "tienda": p.tienda.nombre if p.tienda else None,
-            "tienda_id": p.tienda.id if p.tienda else None,
 
-            "marca": p.marca.nombre if p.marca else None,
-            "marca_id": p.marca.id if p.marca else None,
+    @app.route("/productos/<int:producto_id>/imagen", methods=["GET"])
+    def obtener_imagen_producto(producto_id):
+        """
+        Devuelve la imagen del producto como binario.
 
-            "descripcion": p.descripcion,
+        - ETag = sha256 del contenido (responde 304 con If-None-Match)
+        - Cache-Control de un año: la URL publicada lleva ?v=<hash>,
+          así que cambia cuando cambia la imagen.
 
-            "categoria": p.categoria.nombre if p.categoria else None,
-            "categoria_id": p.categoria.id if p.categoria else None,
+        Primero se lee solo imagen_hash: si coincide con If-None-Match se
+        responde 304 sin cargar la columna imagen. Las filas anteriores al
+        hash se sirven calculándolo en memoria; para guardarlo usar
+        `flask backfill-imagen-hash` (un GET no escribe en la BD).
+        """
+        row = (
+            db.session.query(Producto.imagen_hash, Producto.imagen.isnot(None).label("tiene_imagen"))
+            .filter(Producto.id == producto_id)
+            .first()
+        )
+        if row is None or not row.tiene_imagen:
+            return jsonify({"error": "producto sin imagen"}), 404
+
+        cache_control = "public, max-age=31536000, immutable"
+        if row.imagen_hash and request.if_none_match.contains_weak(row.imagen_hash):
+            resp = Response(status=304)
+            resp.set_etag(row.imagen_hash)
+            resp.headers["Cache-Control"] = cache_control
+            return resp
+
+        imagen = db.session.query(Producto.imagen).filter(Producto.id == producto_id).scalar()
+        if not imagen:
+            return jsonify({"error": "producto sin imagen"}), 404
+        imagen_hash = row.imagen_hash or hashlib.sha256(imagen.encode("utf-8")).hexdigest()
+
+        if imagen.startswith(("http://", "https://")):
+            return redirect(imagen)
+
+        mimetype = "application/octet-stream"
+        payload = imagen
+        if imagen.startswith("data:"):
+            header, _, payload = imagen.partition(",")
+            mimetype = header[len("data:"):].split(";")[0] or mimetype
+        try:
+            contenido = base64.b64decode(payload)
+        except (ValueError, binascii.Error):
+            return jsonify({"error": "imagen con formato inválido"}), 500
 
-            "talla": p.talla.nombre if p.talla else None,
-            "talla_id": p.talla.id if p.talla else None,
+        resp = Response(contenido, mimetype=mimetype)
+        resp.set_etag(imagen_hash)
+        resp.headers["Cache-Control"] = cache_control
+        return resp.make_conditional(request)
 
-            "costo": float(p.costo),
-            "precio": float(p.precio),
-            "cantidad": p.cantidad,
-            "imagen": p.imagen,
-        })
 
+    def resolver_referencia(model, ref_id, nombre):
+        """
+        Resuelve el id de una tabla de referencia (tienda, marca, categoría,
+        talla) usando el cache en memoria:
+        - si viene ref_id (int o string numérico), debe existir (ValueError si no)
+        - si no, busca por nombre y lo crea si no existe
+        Devuelve None si no viene ninguno de los dos.
+        """
+        cache = reference_caches[model]
+        if ref_id is not None:
+            # Los <select> del front mandan el id como string ("1")
+            try:
+                ref_id = int(ref_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"{model.__tablename__}: id {ref_id!r} inválido")
+            if not cache.exists(ref_id):
+                raise ValueError(f"{model.__tablename__}: id {ref_id} no existe")
+            return ref_id
+        if not nombre:
+            return None
+        nombre = str(nombre)
+        existente = cache.get_id(nombre)
+        if existente is not None:
+            return existente
+        nuevo = model(nombre=nombre)
+        db.session.add(nuevo)
+        db.session.flush()
+        return nuevo.id
 
     @app.route("/productos", methods=["POST"])
     def crear_producto():
         data = request.get_json()
 
         # ===== TIENDA (requerida) =====
-        tienda = None
-        tienda_id = data.get("tienda_id")
-        if tienda_id is not None:
-            tienda = Tienda.query.get(tienda_id)
-            if not tienda:
-                return jsonify({"error": "tienda_id inválido"}), 400
-        else:
-            tienda_nombre = data.get("tienda")
-            if not tienda_nombre:
-                return jsonify({"error": "tienda es requerida"}), 400
-            tienda = Tienda.query.filter_by(nombre=str(tienda_nombre)).first()
-            if not tienda:
-                tienda = Tienda(nombre=str(tienda_nombre))
-                db.session.add(tienda)
-                db.session.flush()
+        try:
+            tienda_id = resolver_referencia(Tienda, data.get("tienda_id"), data.get("tienda"))
+        except ValueError:
+            return jsonify({"error": "tienda_id inválido"}), 400
+        if tienda_id is None:
+            return jsonify({"error": "tienda es requerida"}), 400
 
         # ===== MARCA (opcional) =====
-        marca = None
-        marca_id = data.get("marca_id")
-        if marca_id is not None:
-            marca = MarcaProducto.query.get(marca_id)
-            if not marca:
-                return jsonify({"error": "marca_id inválido"}), 400
-        else:
-            marca_nombre = data.get("marca")
-            if marca_nombre:
-                marca = MarcaProducto.query.filter_by(nombre=str(marca_nombre)).first()
-                if not marca:
-                    marca = MarcaProducto(nombre=str(marca_nombre))
-                    db.session.add(marca)
-                    db.session.flush()
+        try:
+            marca_id = resolver_referencia(MarcaProducto, data.get("marca_id"), data.get("marca"))
+        except ValueError:
+            return jsonify({"error": "marca_id inválido"}), 400
 
         # ===== CATEGORÍA (opcional) =====
-        categoria = None
-        categoria_id = data.get("categoria_id")
-        if categoria_id is not None:
-            categoria = CategoriaProducto.query.get(categoria_id)
-            if not categoria:
-                return jsonify({"error": "categoria_id inválido"}), 400
-        else:
-            categoria_nombre = data.get("categoria")
-            if categoria_nombre:
-                categoria = CategoriaProducto.query.filter_by(nombre=str(categoria_nombre)).first()
-                if not categoria:
-                    categoria = CategoriaProducto(nombre=str(categoria_nombre))
-                    db.session.add(categoria)
-                    db.session.flush()
+        try:
+            categoria_id = resolver_referencia(
+                CategoriaProducto, data.get("categoria_id"), data.get("categoria")
+            )
+        except ValueError:
+            return jsonify({"error": "categoria_id inválido"}), 400
 
         # ===== TALLA (opcional) =====
-        talla = None
-        talla_id = data.get("talla_id")
-        if talla_id is not None:
-            talla = Talla.query.get(talla_id)
-            if not talla:
-                return jsonify({"error": "talla_id inválido"}), 400
-        else:
-            talla_nombre = data.get("talla")
-            if talla_nombre:
-                talla = Talla.query.filter_by(nombre=str(talla_nombre)).first()
-                if not talla:
-                    talla = Talla(nombre=str(talla_nombre))
-                    db.session.add(talla)
-                    db.session.flush()
+        try:
+            talla_id = resolver_referencia(Talla, data.get("talla_id"), data.get("talla"))
+        except ValueError:
+            return jsonify({"error": "talla_id inválido"}), 400
 
         # ===== PRODUCTO =====
         # sku es opcional
@@ -195,10 +370,10 @@ def create_app():
 
         p = Producto(
             sku=sku,
-            tienda=tienda,
-            marca=marca,
-            categoria=categoria,
-            talla=talla,
+            tienda_id=tienda_id,
+            marca_id=marca_id,
+            categoria_id=categoria_id,
+            talla_id=talla_id,
             descripcion=descripcion,
             costo=costo,
             precio=precio,
@@ -212,6 +387,203 @@ def create_app():
         return jsonify({"id": p.id}), 201
 
 
+    PRODUCTO_REFERENCIAS = (
+        ("tienda", Tienda),
+        ("marca", MarcaProducto),
+        ("categoria", CategoriaProducto),
+        ("talla", Talla),
+    )
+
+    INT_MAX = 2**31 - 1  # db.Integer es int4 en Postgres
+
+    def texto_bulk(valor, columna, campo):
+        """str del valor; ValueError si no cabe en el String(n) de la columna."""
+        valor = str(valor)
+        largo = columna.type.length
+        if largo is not None and len(valor) > largo:
+            raise ValueError(f"{campo} excede {largo} caracteres")
+        return valor
+
+    def decimal_bulk(valor, columna, campo):
+        """
+        Decimal redondeado a la escala del Numeric(p, s) de la columna;
+        ValueError si no es un número finito o no cabe en la precisión.
+        """
+        try:
+            numero = Decimal(str(valor))
+        except InvalidOperation:
+            raise ValueError(f"{campo} inválido")
+        if not numero.is_finite():
+            raise ValueError(f"{campo} inválido")
+        escala, precision = columna.type.scale, columna.type.precision
+        # Como Postgres al guardar en Numeric: redondeo half-up
+        numero = numero.quantize(Decimal(1).scaleb(-escala), rounding=ROUND_HALF_UP)
+        if abs(numero) >= Decimal(10) ** (precision - escala):
+            raise ValueError(f"{campo} fuera de rango")
+        return numero
+
+    def leer_filas_bulk():
+        """
+        Lee las filas de POST /productos/bulk: un arreglo JSON, un archivo CSV
+        en el campo 'archivo' (multipart) o un body text/csv.
+        En CSV las celdas vacías se toman como null.
+        """
+        archivo = request.files.get("archivo")
+        if archivo is not None:
+            texto = archivo.read().decode("utf-8-sig")
+        elif request.mimetype == "text/csv":
+            texto = request.get_data().decode("utf-8-sig")
+        else:
+            filas = request.get_json(silent=True)
+            if not isinstance(filas, list):
+                raise ValueError("se espera un arreglo JSON o un archivo CSV")
+            return filas
+        return [
+            {k.strip(): (v.strip() if v and v.strip() else None) for k, v in fila.items() if k}
+            for fila in csv.DictReader(io.StringIO(texto))
+        ]
+
+    @app.route("/productos/bulk", methods=["POST"])
+    def crear_productos_bulk():
+        """
+        Importa muchos productos en una sola transacción.
+
+        Acepta los mismos campos que POST /productos, como arreglo JSON o CSV
+        (columnas: sku, tienda/tienda_id, marca/marca_id, categoria/categoria_id,
+        talla/talla_id, descripcion, costo, precio, cantidad, imagen).
+
+        Tiendas, marcas, categorías y tallas se resuelven (y crean) con una
+        consulta por tabla, y los productos se insertan en un INSERT por lotes.
+        Las filas inválidas (incluidos largos y rangos que la BD rechazaría) se
+        reportan en "errores" sin afectar a las demás. Si aun así falla el
+        INSERT por lotes, se reintenta fila por fila con un SAVEPOINT cada una:
+
+        {
+          "creados": 2,
+          "ids": [{"fila": 1, "id": 10}, {"fila": 3, "id": 11}],
+          "errores": [{"fila": 2, "error": "precio inválido"}]
+        }
+        """
+        try:
+            filas = leer_filas_bulk()
+        except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+            return jsonify({"error": str(exc)}), 400
+
+        errores = []
+        validas = []  # (numero_fila, valores para el INSERT, {campo: nombre} por resolver)
+
+        # 1) Validación por fila (sin tocar la BD salvo el cache de referencia)
+        for numero, fila in enumerate(filas, start=1):
+            if not isinstance(fila, dict):
+                errores.append({"fila": numero, "error": "cada fila debe ser un objeto"})
+                continue
+            try:
+                descripcion = fila.get("descripcion")
+                if not descripcion:
+                    raise ValueError("descripcion es requerida")
+                sku = fila.get("sku")
+                valores = {
+                    "sku": texto_bulk(sku, Producto.sku, "sku") if sku is not None else None,
+                    "descripcion": texto_bulk(descripcion, Producto.descripcion, "descripcion"),
+                    "imagen": fila.get("imagen"),
+                    "imagen_hash": None,
+                }
+                for campo in ("costo", "precio"):
+                    if fila.get(campo) is None:
+                        raise ValueError(f"{campo} es requerido")
+                    valores[campo] = decimal_bulk(fila[campo], getattr(Producto, campo), campo)
+                try:
+                    valores["cantidad"] = int(fila.get("cantidad") or 0)
+                except (TypeError, ValueError):
+                    raise ValueError("cantidad inválida")
+                if abs(valores["cantidad"]) > INT_MAX:
+                    raise ValueError("cantidad fuera de rango")
+                if valores["imagen"]:
+                    valores["imagen_hash"] = hashlib.sha256(valores["imagen"].encode("utf-8")).hexdigest()
+
+                por_nombre = {}
+                for campo, model in PRODUCTO_REFERENCIAS:
+                    ref_id = fila.get(f"{campo}_id")
+                    valores[f"{campo}_id"] = None
+                    if ref_id is not None:
+                        try:
+                            ref_id = int(ref_id)
+                        except (TypeError, ValueError):
+                            raise ValueError(f"{campo}_id inválido")
+                        if not reference_caches[model].exists(ref_id):
+                            raise ValueError(f"{campo}_id inválido")
+                        valores[f"{campo}_id"] = ref_id
+                    elif fila.get(campo):
+                        por_nombre[campo] = texto_bulk(fila[campo], model.nombre, campo)
+                if valores["tienda_id"] is None and "tienda" not in por_nombre:
+                    raise ValueError("tienda es requerida")
+            except ValueError as exc:
+                errores.append({"fila": numero, "error": str(exc)})
+                continue
+            validas.append((numero, valores, por_nombre))
+
+        # 2) Resolver/crear referencias por nombre: un SELECT ... IN por tabla
+        #    y un INSERT por lotes con las que falten
+        creadas = set()
+        for campo, model in PRODUCTO_REFERENCIAS:
+            nombres = {por_nombre[campo] for _, _, por_nombre in validas if campo in por_nombre}
+            if not nombres:
+                continue
+            ids = dict(
+                db.session.query(model.nombre, model.id).filter(model.nombre.in_(nombres)).all()
+            )
+            faltantes = nombres - ids.keys()
+            if faltantes:
+                db.session.execute(insert(model), [{"nombre": n} for n in sorted(faltantes)])
+                ids.update(
+                    db.session.query(model.nombre, model.id).filter(model.nombre.in_(faltantes)).all()
+                )
+                creadas.add(model)
+            for _, valores, por_nombre in validas:
+                if campo in por_nombre:
+                    valores[f"{campo}_id"] = ids[por_nombre[campo]]
+
+        # 3) Productos en un solo INSERT por lotes; si la BD rechaza alguna
+        #    fila, se reintenta una por una para reportar cuál falló
+        creados = []
+        stmt = insert(Producto).returning(Producto.id, sort_by_parameter_order=True)
+        if validas:
+            try:
+                with db.session.begin_nested():
+                    result = db.session.execute(stmt, [valores for _, valores, _ in validas])
+                    ids = result.scalars().all()
+                creados = [
+                    {"fila": numero, "id": producto_id}
+                    for (numero, _, _), producto_id in zip(validas, ids)
+                ]
+            except DBAPIError:
+                for numero, valores, _ in validas:
+                    try:
+                        with db.session.begin_nested():
+                            producto_id = db.session.execute(stmt, [valores]).scalar_one()
+                        creados.append({"fila": numero, "id": producto_id})
+                    except DBAPIError as exc:
+                        errores.append({"fila": numero, "error": str(exc.orig)})
+                errores.sort(key=lambda e: e["fila"])
+
+        try:
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            return jsonify({"error": "No se pudo importar los productos", "detail": str(exc)}), 400
+        finally:
+            # Los INSERT de Core no pasan por el flush del ORM
+            for model in creadas:
+                reference_caches[model].invalidate()
+
+        status = 201 if creados or not errores else 400
+        return jsonify({
+            "creados": len(creados),
+            "ids": creados,
+            "errores": errores,
+        }), status
+
+
     @app.route("/productos/<int:producto_id>", methods=["PUT", "PATCH"])
     def actualizar_producto(producto_id):
         p = Producto.query.get_or_404(producto_id)
@@ -225,87 +597,35 @@ def create_app():
         if "descripcion" in data:
             p.descripcion = data["descripcion"]
 
-        # TIENDA
-        if "tienda_id" in data:
-            tienda = Tienda.query.get(data["tienda_id"])
-            if not tienda:
+        # TIENDA / MARCA / CATEGORÍA / TALLA
+        # Si viene <campo>_id tiene prioridad sobre el nombre; en las
+        # opcionales un id null o un nombre vacío quitan la referencia.
+        if "tienda_id" in data or data.get("tienda"):
+            try:
+                tienda_id = resolver_referencia(
+                    Tienda, data.get("tienda_id"), None if "tienda_id" in data else data.get("tienda")
+                )
+            except ValueError:
+                tienda_id = None
+            if tienda_id is None:
                 return jsonify({"error": "tienda_id inválido"}), 400
-            p.tienda = tienda
-        elif "tienda" in data:
-            tienda_nombre = data.get("tienda")
-            if tienda_nombre:
-                tienda = Tienda.query.filter_by(nombre=tienda_nombre).first()
-                if not tienda:
-                    tienda = Tienda(nombre=tienda_nombre)
-                    db.session.add(tienda)
-                    db.session.flush()
-                p.tienda = tienda
-
-        # MARCA
-        if "marca_id" in data:
-            marca_id = data.get("marca_id")
-            if marca_id is None:
-                p.marca = None
-            else:
-                m = MarcaProducto.query.get(marca_id)
-                if not m:
-                    return jsonify({"error": "marca_id inválido"}), 400
-                p.marca = m
-        elif "marca" in data:
-            marca_nombre = data.get("marca")
-            if marca_nombre:
-                m = MarcaProducto.query.filter_by(nombre=marca_nombre).first()
-                if not m:
-                    m = MarcaProducto(nombre=marca_nombre)
-                    db.session.add(m)
-                    db.session.flush()
-                p.marca = m
-            else:
-                p.marca = None
-
-        # CATEGORÍA
-        if "categoria_id" in data:
-            categoria_id = data.get("categoria_id")
-            if categoria_id is None:
-                p.categoria = None
-            else:
-                cat = CategoriaProducto.query.get(categoria_id)
-                if not cat:
-                    return jsonify({"error": "categoria_id inválido"}), 400
-                p.categoria = cat
-        elif "categoria" in data:
-            categoria_nombre = data.get("categoria")
-            if categoria_nombre:
-                cat = CategoriaProducto.query.filter_by(nombre=categoria_nombre).first()
-                if not cat:
-                    cat = CategoriaProducto(nombre=categoria_nombre)
-                    db.session.add(cat)
-                    db.session.flush()
-                p.categoria = cat
-            else:
-                p.categoria = None
-
-        # TALLA (opcional)
-        if "talla_id" in data:
-            talla_id = data.get("talla_id")
-            if talla_id is None:
-                p.talla = None
-            else:
-                t = Talla.query.get(talla_id)
-                if not t:
-                    return jsonify({"error": "talla_id inválido"}), 400
-                p.talla = t
-        elif "talla" in data:
-            talla_nombre = data.get("talla")
-            if talla_nombre:
-                t = Talla.query.filter_by(nombre=talla_nombre).first()
-                if not t:
-                    t = Talla(nombre=talla_nombre)
-                    db.session.add(t)
-                    db.session.flush()
-                p.talla = t
-            else:
-                p.talla = None
+            p.tienda_id = tienda_id
+
+        for campo, model in (
+            ("marca", MarcaProducto),
+            ("categoria", CategoriaProducto),
+            ("talla", Talla),
+        ):
+            campo_id = f"{campo}_id"
+            if campo_id not in data and campo not in data:
+                continue
+            try:
+                ref_id = resolver_referencia(
+                    model, data.get(campo_id), None if campo_id in data else data.get(campo)
+                )
+            except ValueError:
+                return jsonify({"error": f"{campo_id} inválido"}), 400
+            setattr(p, campo_id, ref_id)
 
         # Campos numéricos / otros
         if "costo" in data:
@@ -357,6 +677,178 @@ def create_app():
         fmt = "%H:%M:%S" if value.count(":") == 2 else "%H:%M"
         return datetime.strptime(value, fmt).time()
 
+    # ---------- Paginación por cursor (keyset) ----------
+
+    DEFAULT_PAGE_LIMIT = 50
+    MAX_PAGE_LIMIT = 500
+
+    def _cursor_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    def encode_cursor(values):
+        raw = json.dumps([_cursor_value(v) for v in values]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    def decode_cursor(cursor: str, columns):
+        """
+        Decodifica un cursor generado por encode_cursor y convierte cada valor
+        al tipo python de su columna (datetime, date, etc.).
+        Lanza ValueError si el cursor no es válido.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except Exception:
+            raise ValueError("cursor inválido")
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor inválido")
+        parsed = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = parse_iso_datetime(value)
+            elif python_type is date:
+                value = parse_iso_date(value)
+            parsed.append(value)
+        return parsed
+
+    STREAM_CHUNK_SIZE = 500
+
+    def fila_to_dict(row):
+        """Dict de una fila de columnas (las claves son los nombres de columna)."""
+        return row._asdict()
+
+    def serialize_records(records, serialize, batch=False):
+        """Lista de dicts; con batch, serialize recibe todas las filas juntas."""
+        if batch:
+            return serialize(records)
+        return [serialize(r) for r in records]
+
+    def stream_response(query, serialize, formato, batch=False):
+        """
+        Envía el resultado de query por partes, sin armar la lista completa.
+
+        - formato "json":   un arreglo JSON, emitido de a STREAM_CHUNK_SIZE filas
+        - formato "ndjson": un objeto JSON por línea
+
+        yield_per usa un cursor del lado del servidor (psycopg2), así que
+        en memoria solo vive un lote de filas a la vez.
+        """
+        def dumps(obj):
+            return app.json.dumps(obj)
+
+        def generar():
+            primero = True
+            if formato == "json":
+                yield "["
+            records = iter(query.yield_per(STREAM_CHUNK_SIZE))
+            while True:
+                lote = list(itertools.islice(records, STREAM_CHUNK_SIZE))
+                if not lote:
+                    break
+                data = serialize_records(lote, serialize, batch)
+                if formato == "ndjson":
+                    yield "".join(dumps(obj) + "\n" for obj in data)
+                else:
+                    yield ("" if primero else ",") + ",".join(dumps(obj) for obj in data)
+                    primero = False
+            if formato == "json":
+                yield "]"
+
+        mimetype = "application/x-ndjson" if formato == "ndjson" else "application/json"
+        return Response(stream_with_context(generar()), mimetype=mimetype)
+
+    def keyset_response(query, sort_column, serialize, descending=False, streamable=False, batch=False):
+        """
+        Responde un listado ordenado por (sort_column, id).
+
+        Sin ?limit ni ?after devuelve el arreglo completo (comportamiento
+        original). Con ?limit=N y/o ?after=<cursor> devuelve una página:
+
+        {
+          "items": [...],
+          "next_cursor": "..." | null
+        }
+
+        La página siguiente se filtra con una comparación de fila sobre las
+        columnas de orden, así que su costo no depende de la profundidad.
+
+        Si streamable, ?stream=json|ndjson envía el listado completo en
+        streaming (ver stream_response).
+
+        query puede ser de instancias ORM o de columnas (filas Row con las
+        columnas de orden incluidas). Con batch, serialize recibe la lista
+        de filas de la página (para cargar sus hijos en una sola query).
+        """
+        id_column = sort_column.class_.id
+        columns = [sort_column] if sort_column is id_column else [sort_column, id_column]
+        order = [c.desc() if descending else c.asc() for c in columns]
+
+        limit_str = request.args.get("limit")
+        after = request.args.get("after")
+
+        formato = request.args.get("stream")
+        if streamable and formato:
+            if formato not in ("json", "ndjson"):
+                return jsonify({"error": "stream debe ser json o ndjson"}), 400
+            return stream_response(query.order_by(*order), serialize, formato, batch)
+
+        if limit_str is None and not after:
+            records = query.order_by(*order).all()
+            return jsonify(serialize_records(records, serialize, batch))
+
+        try:
+            limit = int(limit_str) if limit_str is not None else DEFAULT_PAGE_LIMIT
+        except ValueError:
+            return jsonify({"error": "limit debe ser un entero"}), 400
+        if limit < 1:
+            return jsonify({"error": "limit debe ser mayor a 0"}), 400
+        limit = min(limit, MAX_PAGE_LIMIT)
+
+        if after:
+            try:
+                values = decode_cursor(after, columns)
+            except ValueError:
+                return jsonify({"error": "cursor 'after' inválido"}), 400
+            key = tuple_(*columns) if len(columns) > 1 else columns[0]
+            bound = tuple_(*values) if len(columns) > 1 else values[0]
+            query = query.filter(key < bound if descending else key > bound)
+
+        records = query.order_by(*order).limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        next_cursor = None
+        if has_more:
+            last = records[-1]
+            next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+
+        return jsonify({
+            "items": serialize_records(records, serialize, batch),
+            "next_cursor": next_cursor,
+        })
+
+    def bloquear_fila(model, pk):
+        """
+        Relee la fila con SELECT ... FOR UPDATE; el bloqueo dura hasta el
+        commit/rollback de la transacción actual.
+        """
+        return model.query.filter_by(id=pk).populate_existing().with_for_update().one()
+
+    def ajustar_reservadas(session_id: int, delta: int):
+        """Suma delta a ClassSession.reservadas en SQL (sin read-modify-write)."""
+        db.session.execute(
+            update(ClassSession)
+            .where(ClassSession.id == session_id)
+            .values(reservadas=ClassSession.reservadas + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    def incluir_payments():
+        """?payments=0|false omite los pagos anidados en la respuesta."""
+        return request.args.get("payments", "1").lower() not in ("0", "false")
+
     def get_client_balance(client_id: int):
         client = Client.query.get(client_id)
         if not client:
@@ -364,57 +856,178 @@ def create_app():
         return float(client.saldo or 0)
 
     def apply_movement_and_update_balance(client: Client, movement: AccountMovement):
-        current_saldo = Decimal(str(client.saldo or 0))
+        # saldo = saldo + delta en SQL: dos movimientos concurrentes del mismo
+        # cliente no se pisan (no hay read-modify-write en Python)
         delta = Decimal(str(movement.amount or 0))
-        client.saldo = current_saldo + delta
         db.session.add(movement)
-        db.session.add(client)
+        db.session.execute(
+            update(Client)
+            .where(Client.id == client.id)
+            .values(saldo=Client.saldo + delta)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(client, ["saldo"])
 
     def calcular_subtotal_items(items):
         return sum((item.cantidad or 0) * (item.precio_unitario or 0) for item in items)
 
-    # Helper para serializar una orden completa
-    def orden_to_dict(orden: Orden):
-        return {
-            "id": orden.id,
-            "codigo": orden.codigo,
-            "fecha": orden.fecha.isoformat(),
-            "descuento": float(orden.descuento) if orden.descuento is not None else 0,
-            "total": float(orden.total) if orden.total is not None else 0,
-            "tipo_pago": orden.tipo_pago,
-            "referencia_pago": orden.referencia_pago,
-            "cliente": {
-                "id": orden.cliente.id,
-                "nombre": orden.cliente.nombre,
-                "telefono": orden.cliente.telefono,
-                "email": orden.cliente.email,
-                "nit": orden.cliente.nit,
-            },
-            "items": [
-                {
+    def validar_items_orden(items_data):
+        """
+        Valida el payload de items de una orden.
+        Devuelve una lista de (producto_id, cantidad, precio_unitario) o lanza
+        ValueError con el mensaje para el cliente. producto_id y cantidad
+        salen como int (el front puede mandarlos como string).
+        """
+        items = []
+        for item_data in items_data:
+            precio_unitario = item_data.get("precio_unitario")
+
+            if precio_unitario is None:
+                raise ValueError("precio_unitario es requerido en cada item")
+
+            producto_id = item_data.get("producto_id")
+            if not producto_id:
+                raise ValueError("producto_id es requerido en cada item")
+            try:
+                producto_id = int(producto_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"producto_id inválido: {producto_id!r}")
+
+            try:
+                cantidad = int(item_data.get("cantidad", 1))
+            except (TypeError, ValueError):
+                raise ValueError(f"cantidad inválida para producto {producto_id}")
+
+            items.append((producto_id, cantidad, precio_unitario))
+        return items
+
+    def bloquear_productos(producto_ids):
+        """
+        Carga los productos en una sola consulta (IN) con bloqueo de fila
+        (SELECT ... FOR UPDATE), en orden de id para que dos ventas
+        concurrentes no se bloqueen mutuamente en orden inverso.
+        """
+        if not producto_ids:
+            return {}
+        productos = (
+            Producto.query.filter(Producto.id.in_(set(producto_ids)))
+            .order_by(Producto.id)
+            .with_for_update()
+            .all()
+        )
+        return {p.id: p for p in productos}
+
+    def ajustar_inventario(deltas):
+        """
+        Aplica {producto_id: delta} al inventario con un solo UPDATE
+        (cantidad = cantidad + CASE id ... END). El cálculo se hace en SQL,
+        así no se pierden ventas concurrentes del mismo SKU.
+        Delta negativo descuenta (se permite inventario negativo).
+
+        Como cualquier escritura de Producto, incrementa la versión de
+        productos al confirmar (el ETag de /productos incluye cantidad);
+        ver versioning._bump sobre el lock que eso implica.
+        """
+        deltas = {pid: delta for pid, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        db.session.execute(
+            update(Producto)
+            .where(Producto.id.in_(deltas.keys()))
+            .values(cantidad=Producto.cantidad + case(deltas, value=Producto.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+
+    # Listado de órdenes por columnas: una query para órdenes + cliente y
+    # otra para los items + producto de cada lote, sin instancias ORM
+    ORDEN_COLUMNAS = (
+        Orden.id,
+        Orden.codigo,
+        Orden.fecha,
+        Orden.descuento,
+        Orden.total,
+        Orden.tipo_pago,
+        Orden.referencia_pago,
+        Cliente.id.label("cliente_id"),
+        Cliente.nombre.label("cliente_nombre"),
+        Cliente.telefono.label("cliente_telefono"),
+        Cliente.email.label("cliente_email"),
+        Cliente.nit.label("cliente_nit"),
+    )
+
+    def ordenes_query():
+        return db.session.query(*ORDEN_COLUMNAS).join(Cliente, Orden.cliente_id == Cliente.id)
+
+    def orden_filas_to_dicts(rows):
+        """Serializa filas de ordenes_query() con sus items (formato de /ordenes)."""
+        items = {}
+        ids = [row.id for row in rows]
+        for i in range(0, len(ids), STREAM_CHUNK_SIZE):
+            for item in (
+                db.session.query(
+                    OrdenItem.id,
+                    OrdenItem.orden_id,
+                    OrdenItem.producto_id,
+                    OrdenItem.cantidad,
+                    OrdenItem.precio_unitario,
+                    Producto.descripcion,
+                    Producto.sku,
+                    Producto.tienda_id,
+                    Producto.marca_id,
+                    Producto.categoria_id,
+                    Producto.talla_id,
+                    Producto.costo,
+                )
+                .join(Producto, OrdenItem.producto_id == Producto.id)
+                .filter(OrdenItem.orden_id.in_(ids[i:i + STREAM_CHUNK_SIZE]))
+                .order_by(OrdenItem.id)
+            ):
+                items.setdefault(item.orden_id, []).append({
                     "id": item.id,
                     "producto_id": item.producto_id,
                     "cantidad": item.cantidad,
-                    "precio_unitario": float(item.precio_unitario),
-                    # 🔹 info básica del producto (sin meter objetos crudos)
+                    "precio_unitario": item.precio_unitario,
                     "producto": {
-                        "id": item.producto.id,
-                        "descripcion": item.producto.descripcion,
-                        "sku": item.producto.sku,
-                        "tienda_id": item.producto.tienda_id,
-                        "tienda": item.producto.tienda.nombre if item.producto.tienda else None,
-                        "marca": item.producto.marca.nombre if item.producto.marca else None,
-                        "categoria": item.producto.categoria.nombre if item.producto.categoria else None,
-                        "talla_id": item.producto.talla_id,
-                        "talla": item.producto.talla.nombre if item.producto.talla else None,
-                        "costo": float(item.producto.costo) if item.producto and item.producto.costo is not None else None,
-                    } if item.producto else None,
-                }
-                for item in orden.items
-            ],
-        }
-
+                        "id": item.producto_id,
+                        "descripcion": item.descripcion,
+                        "sku": item.sku,
+                        "tienda_id": item.tienda_id,
+                        "tienda": reference_caches[Tienda].get_nombre(item.tienda_id),
+                        "marca": reference_caches[MarcaProducto].get_nombre(item.marca_id),
+                        "categoria": reference_caches[CategoriaProducto].get_nombre(item.categoria_id),
+                        "talla_id": item.talla_id,
+                        "talla": reference_caches[Talla].get_nombre(item.talla_id),
+                        "costo": item.costo,
+                    },
+                })
+
+        return [
+            {
+                "id": row.id,
+                "codigo": row.codigo,
+                "fecha": row.fecha,
+                "descuento": row.descuento if row.descuento is not None else 0,
+                "total": row.total if row.total is not None else 0,
+                "tipo_pago": row.tipo_pago,
+                "referencia_pago": row.referencia_pago,
+                "cliente": {
+                    "id": row.cliente_id,
+                    "nombre": row.cliente_nombre,
+                    "telefono": row.cliente_telefono,
+                    "email": row.cliente_email,
+                    "nit": row.cliente_nit,
+                },
+                "items": items.get(row.id, []),
+            }
+            for row in rows
+        ]
 
+    # Helper para serializar una orden completa: el mismo camino que el
+    # listado, así el detalle y /ordenes no pueden diferir
+    def orden_to_dict(orden_id):
+        """Orden con sus items, o None si no existe."""
+        row = ordenes_query().filter(Orden.id == orden_id).one_or_none()
+        return orden_filas_to_dicts([row])[0] if row is not None else None
 
     # ---------- CRUD ORDENES ----------
 
@@ -426,15 +1039,18 @@ def create_app():
         Query params:
         - inicio: fecha/hora ISO 8601 (ej: 2025-11-01T00:00:00Z)
         - fin:    fecha/hora ISO 8601 (ej: 2025-11-30T23:59:59Z)
+        - limit / after: paginación por cursor (ver keyset_response)
+        - stream: json | ndjson para exportar en streaming
 
         Ejemplos:
         GET /ordenes
         GET /ordenes?inicio=2025-11-01T00:00:00Z&fin=2025-11-30T23:59:59Z
+        GET /ordenes?limit=100&after=<next_cursor>
         """
         inicio_str = request.args.get("inicio")
         fin_str = request.args.get("fin")
 
-        query = Orden.query
+        query = ordenes_query()
 
         # Filtro fecha inicio
         if inicio_str:
@@ -452,15 +1068,17 @@ def create_app():
                 return jsonify({"error": "parametro 'fin' debe estar en formato ISO 8601"}), 400
             query = query.filter(Orden.fecha <= fin)
 
-        ordenes = query.order_by(Orden.fecha.desc()).all()
-        data = [orden_to_dict(o) for o in ordenes]
-        return jsonify(data)
+        return keyset_response(
+            query, Orden.fecha, orden_filas_to_dicts, descending=True, streamable=True, batch=True
+        )
 
 
     @app.route("/ordenes/<int:orden_id>", methods=["GET"])
     def obtener_orden(orden_id):
-        orden = Orden.query.get_or_404(orden_id)
-        return jsonify(orden_to_dict(orden))
+        orden = orden_to_dict(orden_id)
+        if orden is None:
+            abort(404)
+        return jsonify(orden)
 
 
     @app.route("/ordenes", methods=["POST"])
@@ -544,24 +1162,22 @@ def create_app():
         if not items_data:
             return jsonify({"error": "debe incluir al menos un item en 'items'"}), 400
 
-        subtotal = 0
-        for item_data in items_data:
-            cantidad = item_data.get("cantidad", 1)
-            precio_unitario = item_data.get("precio_unitario")
-
-            if precio_unitario is None:
-                return jsonify({"error": "precio_unitario es requerido en cada item"}), 400
+        try:
+            items = validar_items_orden(items_data)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
 
-            producto_id = item_data.get("producto_id")
-            if not producto_id:
-                return jsonify({"error": "producto_id es requerido en cada item"}), 400
+        productos = bloquear_productos([producto_id for producto_id, _, _ in items])
 
-            producto = Producto.query.get(producto_id)
+        subtotal = 0
+        deltas = {}
+        for producto_id, cantidad, precio_unitario in items:
+            producto = productos.get(producto_id)
             if not producto:
                 return jsonify({"error": f"producto {producto_id} no existe"}), 400
 
             # Descontar inventario (se permite negativo)
-            producto.cantidad = (producto.cantidad or 0) - cantidad
+            deltas[producto_id] = deltas.get(producto_id, 0) - cantidad
             subtotal += cantidad * precio_unitario
 
             orden_item = OrdenItem(
@@ -572,14 +1188,17 @@ def create_app():
             )
             db.session.add(orden_item)
 
+        ajustar_inventario(deltas)
+
         descuento_val = data.get("descuento", 0) or 0
         total_val = data.get("total")
         orden.descuento = descuento_val
         orden.total = total_val if total_val is not None else subtotal - float(descuento_val)
 
+        orden_id = orden.id
         db.session.commit()
 
-        return jsonify(orden_to_dict(orden)), 201
+        return jsonify(orden_to_dict(orden_id)), 201
 
 
     @app.route("/ordenes/<int:orden_id>", methods=["PUT", "PATCH"])
@@ -623,32 +1242,33 @@ def create_app():
 
         # Reemplazar items si viene "items"
         if "items" in data:
-            # Revertir inventario de los items actuales y borrarlos
-            for item in list(orden.items):
-                if item.producto:
-                    item.producto.cantidad = (item.producto.cantidad or 0) + item.cantidad
+            try:
+                items = validar_items_orden(data["items"])
+            except ValueError as exc:
+                return jsonify({"error": str(exc)}), 400
+
+            items_actuales = list(orden.items)
+            productos = bloquear_productos(
+                [producto_id for producto_id, _, _ in items]
+                + [item.producto_id for item in items_actuales]
+            )
+
+            # Revertir inventario de los items actuales y borrarlos; el neto
+            # (revertido - vendido) se aplica en un solo UPDATE al final
+            deltas = {}
+            for item in items_actuales:
+                deltas[item.producto_id] = deltas.get(item.producto_id, 0) + item.cantidad
                 db.session.delete(item)
             db.session.flush()
 
-            items_data = data["items"]
             subtotal = 0
-            for item_data in items_data:
-                cantidad = item_data.get("cantidad", 1)
-                precio_unitario = item_data.get("precio_unitario")
-
-                if precio_unitario is None:
-                    return jsonify({"error": "precio_unitario es requerido en cada item"}), 400
-
-                producto_id = item_data.get("producto_id")
-                if not producto_id:
-                    return jsonify({"error": "producto_id es requerido en cada item"}), 400
-
-                producto = Producto.query.get(producto_id)
+            for producto_id, cantidad, precio_unitario in items:
+                producto = productos.get(producto_id)
                 if not producto:
                     return jsonify({"error": f"producto {producto_id} no existe"}), 400
 
                 # Descontar inventario (se permite negativo)
-                producto.cantidad = (producto.cantidad or 0) - cantidad
+                deltas[producto_id] = deltas.get(producto_id, 0) - cantidad
                 subtotal += cantidad * precio_unitario
 
                 orden_item = OrdenItem(
@@ -659,6 +1279,7 @@ def create_app():
                 )
                 db.session.add(orden_item)
 
+            ajustar_inventario(deltas)
             orden.total = total_payload if total_payload is not None else subtotal - float(descuento_val)
         else:
             if "total" in data:
@@ -668,7 +1289,7 @@ def create_app():
                 orden.total = subtotal_actual - float(descuento_val)
 
         db.session.commit()
-        return jsonify(orden_to_dict(orden))
+        return jsonify(orden_to_dict(orden_id))
 
 
     @app.route("/ordenes/<int:orden_id>", methods=["DELETE"])
@@ -679,7 +1300,195 @@ def create_app():
         return jsonify({"message": "Orden eliminada"})
 
 
-        # ---------- CRUD USUARIOS ----------
+    # ---------- REPORTES ----------
+
+    @app.route("/reportes/ventas", methods=["GET"])
+    def reporte_ventas():
+        """
+        Resumen de ventas agregado en la BD (GROUP BY), sin traer las órdenes.
+
+        Query params:
+        - inicio / fin: fecha/hora ISO 8601 sobre Orden.fecha (opcionales)
+        - agrupar: dia | tienda | categoria | producto (default: dia)
+        - limit: máximo de filas (útil para top productos)
+
+        Cada fila trae ordenes, unidades, ventas (cantidad * precio_unitario),
+        costo (cantidad * Producto.costo) y margen (ventas - costo).
+        Los descuentos son por orden y no se reparten entre items, así que
+        "descuentos" solo se reporta al agrupar por día.
+        """
+        agrupar = request.args.get("agrupar", "dia")
+        if agrupar not in ("dia", "tienda", "categoria", "producto"):
+            return jsonify({"error": "agrupar debe ser dia, tienda, categoria o producto"}), 400
+
+        filtros = []
+        try:
+            if request.args.get("inicio"):
+                filtros.append(Orden.fecha >= parse_iso_datetime(request.args["inicio"]))
+            if request.args.get("fin"):
+                filtros.append(Orden.fecha <= parse_iso_datetime(request.args["fin"]))
+        except ValueError:
+            return jsonify({"error": "inicio/fin deben estar en formato ISO 8601"}), 400
+        limit = request.args.get("limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return jsonify({"error": "limit debe ser un entero"}), 400
+            if limit < 1:
+                return jsonify({"error": "limit debe ser mayor a 0"}), 400
+
+        # precio_unitario es Float: sin el type_ ventas llega como float y no
+        # se puede restar del costo (Decimal)
+        ventas = func.sum(OrdenItem.cantidad * OrdenItem.precio_unitario, type_=Numeric(12, 2))
+        costo = func.sum(OrdenItem.cantidad * Producto.costo)
+        metricas = (
+            func.count(func.distinct(Orden.id)).label("ordenes"),
+            func.sum(OrdenItem.cantidad).label("unidades"),
+            ventas.label("ventas"),
+            costo.label("costo"),
+        )
+
+        if agrupar == "dia":
+            clave = (func.date(Orden.fecha).label("dia"),)
+        elif agrupar == "tienda":
+            clave = (Producto.tienda_id,)
+        elif agrupar == "categoria":
+            clave = (Producto.categoria_id,)
+        else:
+            clave = (Producto.id, Producto.sku, Producto.descripcion)
+
+        query = (
+            db.session.query(*clave, *metricas)
+            .select_from(OrdenItem)
+            .join(Orden, OrdenItem.orden_id == Orden.id)
+            .join(Producto, OrdenItem.producto_id == Producto.id)
+            .filter(*filtros)
+            .group_by(*clave)
+        )
+        query = query.order_by(clave[0]) if agrupar == "dia" else query.order_by(ventas.desc())
+        if limit:
+            query = query.limit(limit)
+        rows = query.all()
+
+        descuentos = {}
+        if agrupar == "dia":
+            dia = func.date(Orden.fecha)
+            descuentos = dict(
+                db.session.query(dia, func.sum(Orden.descuento))
+                .filter(*filtros)
+                .group_by(dia)
+                .all()
+            )
+
+        data = []
+        for r in rows:
+            fila = {
+                "ordenes": r.ordenes,
+                "unidades": int(r.unidades or 0),
+                "ventas": r.ventas or Decimal("0"),
+                "costo": r.costo or Decimal("0"),
+                "margen": (r.ventas or Decimal("0")) - (r.costo or Decimal("0")),
+            }
+            if agrupar == "dia":
+                # date en Postgres, str en SQLite (el provider serializa ambos igual)
+                fila["dia"] = r.dia
+                fila["descuentos"] = descuentos.get(r.dia) or Decimal("0")
+            elif agrupar == "tienda":
+                fila["tienda_id"] = r.tienda_id
+                fila["tienda"] = reference_caches[Tienda].get_nombre(r.tienda_id)
+            elif agrupar == "categoria":
+                fila["categoria_id"] = r.categoria_id
+                fila["categoria"] = reference_caches[CategoriaProducto].get_nombre(r.categoria_id)
+            else:
+                fila["producto_id"] = r.id
+                fila["sku"] = r.sku
+                fila["descripcion"] = r.descripcion
+            data.append(fila)
+
+        return jsonify({"agrupar": agrupar, "filas": data})
+
+
+    @app.route("/dashboard", methods=["GET"])
+    def dashboard():
+        """
+        Dashboard del estudio: pagos por tipo/método, reservas, asistencia
+        y clases por coach.
+
+        Query params:
+        - desde / hasta: fechas ISO (default: últimos 30 días)
+
+        Lee solo las tablas de rollups diarios, así que el costo depende del
+        rango pedido y no del historial. Los rollups se actualizan con
+        `flask refrescar-rollups`; "actualizado_hasta" indica hasta cuándo.
+        """
+        try:
+            hasta = parse_iso_date(request.args.get("hasta")) or date.today()
+            desde = parse_iso_date(request.args.get("desde")) or hasta - timedelta(days=29)
+        except ValueError:
+            return jsonify({"error": "desde/hasta deben ser fechas ISO válidas"}), 400
+
+        pagos_rows = (
+            DailyPaymentRollup.query
+            .filter(DailyPaymentRollup.dia >= desde, DailyPaymentRollup.dia <= hasta)
+            .order_by(DailyPaymentRollup.dia)
+            .all()
+        )
+        clases_rows = (
+            DailyClassRollup.query
+            .filter(DailyClassRollup.dia >= desde, DailyClassRollup.dia <= hasta)
+            .order_by(DailyClassRollup.dia)
+            .all()
+        )
+        estado = db.session.get(RollupState, ROLLUP_NOMBRE)
+
+        total_pagos = Decimal("0")
+        por_tipo, por_metodo, pagos_por_dia = {}, {}, {}
+        for r in pagos_rows:
+            total_pagos += r.total
+            tipo = r.payment_type or "sin_tipo"
+            metodo = r.payment_method or "sin_metodo"
+            por_tipo[tipo] = por_tipo.get(tipo, Decimal("0")) + r.total
+            por_metodo[metodo] = por_metodo.get(metodo, Decimal("0")) + r.total
+            dia = pagos_por_dia.setdefault(r.dia, {"dia": r.dia, "pagos": 0, "total": Decimal("0")})
+            dia["pagos"] += r.pagos
+            dia["total"] += r.total
+
+        totales = {"clases": 0, "reservas": 0, "asistencias": 0}
+        por_coach, clases_por_dia = {}, {}
+        for r in clases_rows:
+            for destino in (
+                totales,
+                por_coach.setdefault(r.coach_id, {"coach_id": r.coach_id, "clases": 0, "reservas": 0, "asistencias": 0}),
+                clases_por_dia.setdefault(r.dia, {"dia": r.dia, "clases": 0, "reservas": 0, "asistencias": 0}),
+            ):
+                destino["clases"] += r.clases
+                destino["reservas"] += r.reservas
+                destino["asistencias"] += r.asistencias
+
+        def tasa(d):
+            return round(d["asistencias"] / d["reservas"], 4) if d["reservas"] else None
+
+        return jsonify({
+            "desde": desde,
+            "hasta": hasta,
+            "actualizado_hasta": estado.actualizado_hasta if estado else None,
+            "pagos": {
+                "total": total_pagos,
+                "por_tipo": por_tipo,
+                "por_metodo": por_metodo,
+                "por_dia": list(pagos_por_dia.values()),
+            },
+            "clases": dict(
+                totales,
+                tasa_asistencia=tasa(totales),
+                por_coach=[dict(c, tasa_asistencia=tasa(c)) for c in por_coach.values()],
+                por_dia=[dict(d, tasa_asistencia=tasa(d)) for d in clases_por_dia.values()],
+            ),
+        })
+
+
+    # ---------- CRUD USUARIOS ----------
 
     @app.route("/usuarios", methods=["GET"])
     def listar_usuarios():
@@ -687,17 +1496,16 @@ def create_app():
         Lista todos los usuarios.
         No devolvemos password_hash por seguridad.
         """
-        usuarios = Usuario.query.all()
-        data = [
-            {
+        return keyset_response(
+            Usuario.query,
+            Usuario.id,
+            lambda u: {
                 "id": u.id,
                 "username": u.username,
                 "is_admin": u.is_admin,
-                "creado_en": u.creado_en.isoformat(),
-            }
-            for u in usuarios
-        ]
-        return jsonify(data)
+                "creado_en": u.creado_en,
+            },
+        )
 
     @app.route("/usuarios/<int:usuario_id>", methods=["GET"])
     def obtener_usuario(usuario_id):
@@ -709,7 +1517,7 @@ def create_app():
             "id": u.id,
             "username": u.username,
             "is_admin": u.is_admin,
-            "creado_en": u.creado_en.isoformat(),
+            "creado_en": u.creado_en,
         })
 
     @app.route("/usuarios", methods=["POST"])
@@ -750,7 +1558,7 @@ def create_app():
             "id": usuario.id,
             "username": usuario.username,
             "is_admin": usuario.is_admin,
-            "creado_en": usuario.creado_en.isoformat(),
+            "creado_en": usuario.creado_en,
         }), 201
 
     @app.route("/usuarios/<int:usuario_id>", methods=["PUT", "PATCH"])
@@ -788,7 +1596,7 @@ def create_app():
             "id": usuario.id,
             "username": usuario.username,
             "is_admin": usuario.is_admin,
-            "creado_en": usuario.creado_en.isoformat(),
+            "creado_en": usuario.creado_en,
         })
 
     @app.route("/usuarios/<int:usuario_id>", methods=["DELETE"])
@@ -837,6 +1645,7 @@ def create_app():
     # ---------- CRUD CATEGORIAS PRODUCTOS ----------
 
     @app.route("/categorias-productos", methods=["GET"])
+    @versioned(CategoriaProducto)
     def listar_categorias_productos():
         categorias = CategoriaProducto.query.order_by(CategoriaProducto.nombre).all()
         return jsonify([
@@ -902,6 +1711,7 @@ def create_app():
     # ---------- CRUD MARCAS PRODUCTOS ----------
 
     @app.route("/marcas-productos", methods=["GET"])
+    @versioned(MarcaProducto)
     def listar_marcas_productos():
         marcas = MarcaProducto.query.order_by(MarcaProducto.nombre).all()
         return jsonify([
@@ -968,32 +1778,66 @@ def create_app():
     # CRUD CLIENTES
     # =========================
 
+    def cliente_to_dict(c: Cliente):
+        return {
+            "id": c.id,
+            "nombre": c.nombre,
+            "telefono": c.telefono,
+            "email": c.email,
+            "nit": c.nit,
+        }
+
     @app.route("/clientes", methods=["GET"])
     def listar_clientes():
         """
         Lista todos los clientes.
         Opcional: ?q=texto para filtrar por nombre (para el Autocomplete).
+        Opcional: ?limit=N&after=<cursor> para paginar.
         """
         q = request.args.get("q", type=str)
 
         query = Cliente.query
         if q:
-            # filtra por nombre que contenga 'q' (case-insensitive)
+            # filtra por nombre que contenga 'q' (case-insensitive);
+            # en Postgres usa el índice de trigramas ix_clientes_nombre_trgm
             like = f"%{q}%"
             query = query.filter(Cliente.nombre.ilike(like))
 
-        clientes = query.order_by(Cliente.nombre.asc()).all()
+        return keyset_response(query, Cliente.nombre, cliente_to_dict)
 
-        return jsonify([
-            {
-                "id": c.id,
-                "nombre": c.nombre,
-                "telefono": c.telefono,
-                "email": c.email,
-                "nit": c.nit,
-            }
-            for c in clientes
-        ]), 200
+    @app.route("/clientes/buscar", methods=["GET"])
+    def buscar_clientes():
+        """
+        Busca clientes por nombre, teléfono o NIT, ordenados por relevancia
+        (para el Autocomplete del POS).
+        Query params: q (obligatorio), limit (default 20, máx. 100).
+        """
+        q, limite = leer_busqueda()
+        if not q:
+            return jsonify({"error": "q es obligatorio"}), 400
+        clientes = buscar(
+            Cliente.query,
+            q,
+            (Cliente.nombre, Cliente.telefono, Cliente.nit),
+            limite,
+            Cliente.nombre,
+        )
+        return jsonify([cliente_to_dict(c) for c in clientes])
+
+
+    @app.route("/clientes/autocomplete", methods=["GET"])
+    def autocomplete_clientes():
+        """
+        Sugerencias por prefijo de nombre, NIT o teléfono ("ana lo", "5555").
+        Query params: q (obligatorio), limit (default 20, máx. 100).
+        Sin AUTOCOMPLETE_INDEX cae a /clientes/buscar.
+        """
+        q, limite = leer_busqueda()
+        if not q:
+            return jsonify({"error": "q es obligatorio"}), 400
+        if Cliente not in autocomplete:
+            return buscar_clientes()
+        return jsonify(autocomplete[Cliente].search(q, limite))
 
 
     @app.route("/clientes/<int:cliente_id>", methods=["GET"])
@@ -1114,6 +1958,7 @@ def create_app():
     # ---------- CRUD TIENDAS ----------
 
     @app.route("/tiendas", methods=["GET"])
+    @versioned(Tienda)
     def listar_tiendas():
         tiendas = Tienda.query.order_by(Tienda.nombre.asc()).all()
         data = [
@@ -1201,6 +2046,7 @@ def create_app():
     # ---------- CRUD TALLAS ----------
 
     @app.route("/tallas", methods=["GET"])
+    @versioned(Talla)
     def listar_tallas():
         tallas = Talla.query.order_by(Talla.nombre.asc()).all()
         data = [
@@ -1288,8 +2134,51 @@ def create_app():
 
     @app.route("/clients", methods=["GET"])
     def list_clients():
-        records = Client.query.order_by(Client.nombre.asc()).all()
-        return jsonify([c.to_dict() for c in records])
+        return keyset_response(Client.query, Client.nombre, Client.to_dict)
+
+    @app.route("/clients/search", methods=["GET"])
+    def search_clients():
+        """
+        Busca clients por nombre, teléfono o email, ordenados por relevancia.
+        Query params: q (obligatorio), limit (default 20, máx. 100).
+        """
+        q, limite = leer_busqueda()
+        if not q:
+            return jsonify({"error": "q es obligatorio"}), 400
+        return jsonify([c.to_dict() for c in buscar_clients(q, limite)])
+
+    def buscar_clients(q, limite):
+        return buscar(
+            Client.query,
+            q,
+            (Client.nombre, Client.telefono, Client.email),
+            limite,
+            Client.nombre,
+        )
+
+    def client_sugerencia(c: Client):
+        # Mismas claves que el índice de autocomplete (sin activo ni saldo)
+        return {
+            "id": c.id,
+            "nombre": c.nombre,
+            "email": c.email,
+            "telefono": c.telefono,
+        }
+
+    @app.route("/clients/autocomplete", methods=["GET"])
+    def autocomplete_clients():
+        """
+        Sugerencias por prefijo de nombre, email o teléfono.
+        Query params: q (obligatorio), limit (default 20, máx. 100).
+        Sin AUTOCOMPLETE_INDEX busca en la BD como /clients/search, con
+        las mismas claves que el índice.
+        """
+        q, limite = leer_busqueda()
+        if not q:
+            return jsonify({"error": "q es obligatorio"}), 400
+        if Client not in autocomplete:
+            return jsonify([client_sugerencia(c) for c in buscar_clients(q, limite)])
+        return jsonify(autocomplete[Client].search(q, limite))
 
     @app.route("/clients/<int:client_id>", methods=["GET"])
     def get_client(client_id):
@@ -1340,15 +2229,79 @@ def create_app():
         c = Client.query.get_or_404(client_id)
         return jsonify({
             "client_id": c.id,
-            "saldo": float(c.saldo or 0),
+            "saldo": c.saldo if c.saldo is not None else 0,
+        })
+
+    @app.route("/clients/<int:client_id>/ledger", methods=["GET"])
+    def get_client_ledger(client_id):
+        """
+        Estado de cuenta con saldo corrido por movimiento.
+
+        Query params:
+          - desde: fecha ISO (opcional). Sin desde, lista desde el último
+            checkpoint del cliente.
+
+        Parte del último BalanceCheckpoint anterior al rango y suma solo los
+        movimientos posteriores, así el costo no crece con la antigüedad
+        del cliente. Los checkpoints se crean con `flask crear-checkpoints`.
+        """
+        c = Client.query.get_or_404(client_id)
+        try:
+            desde = parse_iso_date(request.args.get("desde"))
+        except ValueError:
+            return jsonify({"error": "desde debe ser una fecha ISO válida"}), 400
+        desde_dt = datetime.combine(desde, time.min) if desde else None
+
+        checkpoints = BalanceCheckpoint.query.filter(BalanceCheckpoint.client_id == c.id)
+        if desde_dt:
+            checkpoints = checkpoints.join(
+                AccountMovement, BalanceCheckpoint.movement_id == AccountMovement.id
+            ).filter(AccountMovement.creado_en < desde_dt)
+        checkpoint = checkpoints.order_by(BalanceCheckpoint.movement_id.desc()).first()
+
+        saldo = Decimal(checkpoint.saldo) if checkpoint else Decimal("0")
+        movimientos = AccountMovement.query.filter(AccountMovement.client_id == c.id)
+        if checkpoint:
+            movimientos = movimientos.filter(AccountMovement.id > checkpoint.movement_id)
+
+        if desde_dt:
+            # Movimientos entre el checkpoint y desde: solo el total
+            previo = (
+                movimientos.with_entities(func.coalesce(func.sum(AccountMovement.amount), 0))
+                .filter(AccountMovement.creado_en < desde_dt)
+                .scalar()
+            )
+            saldo += Decimal(previo)
+            movimientos = movimientos.filter(AccountMovement.creado_en >= desde_dt)
+
+        saldo_inicial = saldo
+        data = []
+        for m in movimientos.order_by(AccountMovement.id).all():
+            saldo += m.amount
+            data.append({
+                "id": m.id,
+                "amount": m.amount,
+                "tipo": m.tipo,
+                "booking_id": m.booking_id,
+                "nota": m.nota,
+                "creado_en": m.creado_en,
+                "saldo": saldo,
+            })
+
+        return jsonify({
+            "client_id": c.id,
+            "checkpoint": checkpoint.to_dict() if checkpoint else None,
+            "saldo_inicial": saldo_inicial,
+            "movimientos": data,
+            "saldo_final": saldo,
         })
 
     # ---------- CRUD COACHES ----------
 
     @app.route("/coaches", methods=["GET"])
+    @versioned(Coach)
     def list_coaches():
-        records = Coach.query.order_by(Coach.nombre.asc()).all()
-        return jsonify([c.to_dict() for c in records])
+        return keyset_response(Coach.query, Coach.nombre, Coach.to_dict)
 
     @app.route("/coaches/<int:coach_id>", methods=["GET"])
     def get_coach(coach_id):
@@ -1397,6 +2350,7 @@ def create_app():
     # ---------- CRUD MEMBERSHIP PLANS ----------
 
     @app.route("/membership-plans", methods=["GET"])
+    @versioned(MembershipPlan)
     def list_membership_plans():
         records = MembershipPlan.query.order_by(MembershipPlan.nombre.asc()).all()
         return jsonify([p.to_dict() for p in records])
@@ -1455,8 +2409,17 @@ def create_app():
 
     @app.route("/memberships", methods=["GET"])
     def list_memberships():
-        records = Membership.query.all()
-        return jsonify([m.to_dict() for m in records])
+        """
+        Lista membresías con sus pagos (precargados en una sola consulta).
+        Opcional: ?payments=0 para omitir los pagos.
+        """
+        incluir = incluir_payments()
+        query = Membership.query
+        if incluir:
+            query = query.options(selectinload(Membership.payments))
+        return keyset_response(
+            query, Membership.id, lambda m: m.to_dict(include_payments=incluir)
+        )
 
     @app.route("/memberships/<int:membership_id>", methods=["GET"])
     def get_membership(membership_id):
@@ -1549,8 +2512,7 @@ def create_app():
 
     @app.route("/class-templates", methods=["GET"])
     def list_class_templates():
-        records = ClassTemplate.query.all()
-        return jsonify([ct.to_dict() for ct in records])
+        return keyset_response(ClassTemplate.query, ClassTemplate.id, ClassTemplate.to_dict)
 
     @app.route("/class-templates/<int:template_id>", methods=["GET"])
     def get_class_template(template_id):
@@ -1623,12 +2585,207 @@ def create_app():
         db.session.commit()
         return jsonify({"message": "ClassTemplate eliminado"})
 
+    MAX_DIAS_GENERACION = 366
+
+    def leer_rango_generacion():
+        """
+        Lee desde/hasta (body JSON o query string) para generar sesiones.
+        Lanza ValueError con el mensaje para el cliente.
+        """
+        data = request.get_json(silent=True) or {}
+        desde_str = data.get("desde") or request.args.get("desde")
+        hasta_str = data.get("hasta") or request.args.get("hasta")
+        if not desde_str or not hasta_str:
+            raise ValueError("desde y hasta son requeridos")
+        try:
+            desde = parse_iso_date(desde_str)
+            hasta = parse_iso_date(hasta_str)
+        except ValueError:
+            raise ValueError("desde/hasta deben ser fechas ISO válidas")
+        if hasta < desde:
+            raise ValueError("hasta debe ser mayor o igual a desde")
+        if (hasta - desde).days > MAX_DIAS_GENERACION:
+            raise ValueError(f"el rango no puede superar {MAX_DIAS_GENERACION} días")
+        return desde, hasta
+
+    def generar_sesiones(templates, desde, hasta):
+        """
+        Crea las ClassSession de cada plantilla entre desde y hasta (inclusive),
+        acotado a fecha_inicio/fecha_fin de la plantilla. dia_semana usa la
+        convención de date.weekday() (0 = lunes).
+
+        Las fechas que ya tienen una sesión de esa plantilla se omiten, así que
+        se puede llamar varias veces sobre el mismo rango. Una consulta para las
+        fechas existentes y un INSERT por lotes para las nuevas.
+        Devuelve (creadas, omitidas).
+        """
+        if not templates:
+            return 0, 0
+
+        existentes = set(
+            db.session.query(ClassSession.template_id, ClassSession.fecha)
+            .filter(
+                ClassSession.template_id.in_([t.id for t in templates]),
+                ClassSession.fecha >= desde,
+                ClassSession.fecha <= hasta,
+            )
+            .all()
+        )
+
+        nuevas = []
+        omitidas = 0
+        for t in templates:
+            inicio = max(desde, t.fecha_inicio) if t.fecha_inicio else desde
+            fin = min(hasta, t.fecha_fin) if t.fecha_fin else hasta
+            if inicio > fin:
+                continue
+            # Primer día del rango que cae en dia_semana
+            fecha = inicio + timedelta(days=(t.dia_semana - inicio.weekday()) % 7)
+            while fecha <= fin:
+                if (t.id, fecha) in existentes:
+                    omitidas += 1
+                else:
+                    nuevas.append({
+                        "template_id": t.id,
+                        "nombre": t.nombre,
+                        "fecha": fecha,
+                        "hora_inicio": t.hora_inicio,
+                        "hora_fin": t.hora_fin,
+                        "coach_id": t.coach_id,
+                        "capacidad": t.capacidad,
+                        "estado": "Programada",
+                        "reservadas": 0,
+                    })
+                fecha += timedelta(days=7)
+
+        if nuevas:
+            db.session.execute(insert(ClassSession), nuevas)
+        return len(nuevas), omitidas
+
+    @app.route("/class-templates/<int:template_id>/generate", methods=["POST"])
+    def generate_class_sessions(template_id):
+        """
+        Genera las sesiones de una plantilla en un rango.
+        Body JSON (o query string): {"desde": "2025-01-01", "hasta": "2025-03-31"}
+        """
+        ct = ClassTemplate.query.get_or_404(template_id)
+        try:
+            desde, hasta = leer_rango_generacion()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        creadas, omitidas = generar_sesiones([ct], desde, hasta)
+        db.session.commit()
+        return jsonify({"creadas": creadas, "omitidas": omitidas}), 201
+
+    @app.route("/class-templates/generate", methods=["POST"])
+    def generate_all_class_sessions():
+        """
+        Genera las sesiones de todas las plantillas en un rango.
+        Body JSON (o query string):
+        {"desde": "2025-01-01", "hasta": "2025-03-31", "estado": "Activa"}
+        estado es opcional y filtra las plantillas.
+        """
+        try:
+            desde, hasta = leer_rango_generacion()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        data = request.get_json(silent=True) or {}
+        estado = data.get("estado") or request.args.get("estado")
+        query = ClassTemplate.query
+        if estado:
+            query = query.filter(ClassTemplate.estado == estado)
+        creadas, omitidas = generar_sesiones(query.all(), desde, hasta)
+        db.session.commit()
+        return jsonify({"creadas": creadas, "omitidas": omitidas}), 201
+
     # ---------- CRUD CLASS SESSIONS ----------
 
     @app.route("/class-sessions", methods=["GET"])
     def list_class_sessions():
-        records = ClassSession.query.all()
-        return jsonify([cs.to_dict() for cs in records])
+        """
+        Lista clases.
+        Filtros opcionales:
+          - desde / hasta: fechas ISO (rango sobre fecha, inclusive)
+          - coach_id, template_id, estado
+          - limit / after: paginación por cursor (ver keyset_response)
+        """
+        query = ClassSession.query
+        try:
+            desde = parse_iso_date(request.args.get("desde"))
+            hasta = parse_iso_date(request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "desde/hasta deben ser fechas ISO válidas"}), 400
+        if desde:
+            query = query.filter(ClassSession.fecha >= desde)
+        if hasta:
+            query = query.filter(ClassSession.fecha <= hasta)
+
+        coach_id = request.args.get("coach_id", type=int)
+        if coach_id is not None:
+            query = query.filter(ClassSession.coach_id == coach_id)
+        template_id = request.args.get("template_id", type=int)
+        if template_id is not None:
+            query = query.filter(ClassSession.template_id == template_id)
+        estado = request.args.get("estado")
+        if estado:
+            query = query.filter(ClassSession.estado == estado)
+
+        return keyset_response(query, ClassSession.id, ClassSession.to_dict)
+
+    @app.route("/class-sessions/availability", methods=["GET"])
+    def class_sessions_availability():
+        """
+        Cupos disponibles por clase en un rango de fechas.
+
+        Query params:
+          - desde: fecha ISO (default: lunes de la semana actual)
+          - hasta: fecha ISO (default: desde + 6 días)
+
+        Una sola consulta sobre class_sessions (índice por fecha), usando el
+        contador ClassSession.reservadas en vez de contar bookings.
+        """
+        try:
+            desde = parse_iso_date(request.args.get("desde"))
+            hasta = parse_iso_date(request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "desde/hasta deben ser fechas ISO válidas"}), 400
+        if desde is None:
+            hoy = date.today()
+            desde = hoy - timedelta(days=hoy.weekday())
+        if hasta is None:
+            hasta = desde + timedelta(days=6)
+
+        rows = (
+            db.session.query(
+                ClassSession.id,
+                ClassSession.nombre,
+                ClassSession.fecha,
+                ClassSession.hora_inicio,
+                ClassSession.hora_fin,
+                ClassSession.coach_id,
+                ClassSession.estado,
+                ClassSession.capacidad,
+                ClassSession.reservadas,
+            )
+            .filter(ClassSession.fecha >= desde, ClassSession.fecha <= hasta)
+            .order_by(ClassSession.fecha, ClassSession.hora_inicio)
+            .all()
+        )
+        return jsonify([
+            {
+                "id": r.id,
+                "nombre": r.nombre,
+                "fecha": r.fecha,
+                "hora_inicio": r.hora_inicio,
+                "hora_fin": r.hora_fin,
+                "coach_id": r.coach_id,
+                "estado": r.estado,
+                "capacidad": r.capacidad,
+                "reservadas": r.reservadas,
+                "disponibles": max(r.capacidad - (r.reservadas or 0), 0),
+            }
+            for r in rows
+        ])
 
     @app.route("/class-sessions/<int:session_id>", methods=["GET"])
     def get_class_session(session_id):
@@ -1702,12 +2859,170 @@ def create_app():
         db.session.commit()
         return jsonify({"message": "ClassSession eliminado"})
 
+    # ---------- CALENDARIO ----------
+
+    def parse_iso_week(value: str):
+        """'2025-W03' -> (lunes, domingo) de esa semana ISO."""
+        year_str, _, week_str = value.upper().partition("-W")
+        lunes = date.fromisocalendar(int(year_str), int(week_str), 1)
+        return lunes, lunes + timedelta(days=6)
+
+    @app.route("/calendar", methods=["GET"])
+    def calendar_week():
+        """
+        Vista semanal del calendario.
+
+        Query params:
+          - semana: semana ISO, ej. 2025-W03 (default: semana actual)
+          - clientes: 1 para incluir las reservas con el nombre de cada cliente
+
+        Se arma con un número fijo de consultas. El ETag sale del último
+        actualizado_en y del número de sesiones/reservas de la semana, así
+        que If-None-Match responde 304 sin leer las sesiones.
+        """
+        semana = request.args.get("semana")
+        try:
+            if semana:
+                desde, hasta = parse_iso_week(semana)
+            else:
+                hoy = date.today()
+                desde = hoy - timedelta(days=hoy.weekday())
+                hasta = desde + timedelta(days=6)
+        except ValueError:
+            return jsonify({"error": "semana debe tener formato YYYY-Www"}), 400
+        incluir_clientes = request.args.get("clientes") in ("1", "true")
+        en_semana = (ClassSession.fecha >= desde, ClassSession.fecha <= hasta)
+
+        # 1) Versión de la semana para el ETag
+        sesiones_ver = (
+            db.session.query(func.max(ClassSession.actualizado_en), func.count(ClassSession.id))
+            .filter(*en_semana)
+            .one()
+        )
+        bookings_ver = (
+            db.session.query(func.max(Booking.actualizado_en), func.count(Booking.id))
+            .join(ClassSession, Booking.session_id == ClassSession.id)
+            .filter(*en_semana)
+            .one()
+        )
+        version = json.dumps(
+            [desde.isoformat(), incluir_clientes, list(sesiones_ver), list(bookings_ver)],
+            default=str,
+        )
+        etag = hashlib.sha256(version.encode("utf-8")).hexdigest()
+        # Comparación débil: con compresión el ETag llega como W/"..."
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+
+        # 2) Sesiones con su coach
+        sesiones = (
+            db.session.query(ClassSession, Coach.nombre.label("coach_nombre"))
+            .join(Coach, ClassSession.coach_id == Coach.id)
+            .filter(*en_semana)
+            .order_by(ClassSession.fecha, ClassSession.hora_inicio)
+            .all()
+        )
+
+        # 3) Conteo de reservas por sesión y estado
+        conteos = {}
+        for session_id, estado, total in (
+            db.session.query(Booking.session_id, Booking.estado, func.count(Booking.id))
+            .join(ClassSession, Booking.session_id == ClassSession.id)
+            .filter(*en_semana)
+            .group_by(Booking.session_id, Booking.estado)
+        ):
+            conteos.setdefault(session_id, {})[estado] = total
+
+        # 4) (opcional) Reservas con nombre de cliente
+        reservas = {}
+        if incluir_clientes:
+            for b in (
+                db.session.query(
+                    Booking.id, Booking.session_id, Booking.estado, Booking.asistio,
+                    Client.id.label("client_id"), Client.nombre,
+                )
+                .join(Client, Booking.client_id == Client.id)
+                .join(ClassSession, Booking.session_id == ClassSession.id)
+                .filter(*en_semana)
+                .order_by(Client.nombre)
+            ):
+                reservas.setdefault(b.session_id, []).append({
+                    "id": b.id,
+                    "estado": b.estado,
+                    "asistio": b.asistio,
+                    "client_id": b.client_id,
+                    "nombre": b.nombre,
+                })
+
+        data = []
+        for cs, coach_nombre in sesiones:
+            item = cs.to_dict()
+            item["coach"] = {"id": cs.coach_id, "nombre": coach_nombre}
+            item["bookings_por_estado"] = conteos.get(cs.id, {})
+            item["disponibles"] = max(cs.capacidad - (cs.reservadas or 0), 0)
+            if incluir_clientes:
+                item["bookings"] = reservas.get(cs.id, [])
+            data.append(item)
+
+        resp = jsonify({
+            "semana": f"{desde.isocalendar()[0]}-W{desde.isocalendar()[1]:02d}",
+            "desde": desde,
+            "hasta": hasta,
+            "sesiones": data,
+        })
+        resp.set_etag(etag)
+        # Que el navegador siempre revalide con el ETag
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
     # ---------- CRUD BOOKINGS ----------
 
+    # Mismas claves que Booking.to_dict, leídas como filas (sin instancias ORM)
+    BOOKING_COLUMNAS = (
+        Booking.id,
+        Booking.session_id,
+        Booking.client_id,
+        Booking.membership_id,
+        Booking.estado,
+        Booking.asistio,
+        Booking.check_in_at,
+    )
+
     @app.route("/bookings", methods=["GET"])
     def list_bookings():
-        records = Booking.query.all()
-        return jsonify([b.to_dict() for b in records])
+        """
+        Lista reservas.
+        Filtros opcionales:
+          - desde / hasta: fechas ISO sobre la fecha de la clase
+          - session_id, client_id, estado
+          - limit / after: paginación por cursor (ver keyset_response)
+        """
+        query = db.session.query(*BOOKING_COLUMNAS)
+        try:
+            desde = parse_iso_date(request.args.get("desde"))
+            hasta = parse_iso_date(request.args.get("hasta"))
+        except ValueError:
+            return jsonify({"error": "desde/hasta deben ser fechas ISO válidas"}), 400
+        if desde or hasta:
+            query = query.join(ClassSession, Booking.session_id == ClassSession.id)
+            if desde:
+                query = query.filter(ClassSession.fecha >= desde)
+            if hasta:
+                query = query.filter(ClassSession.fecha <= hasta)
+
+        session_id = request.args.get("session_id", type=int)
+        if session_id is not None:
+            query = query.filter(Booking.session_id == session_id)
+        client_id = request.args.get("client_id", type=int)
+        if client_id is not None:
+            query = query.filter(Booking.client_id == client_id)
+        estado = request.args.get("estado")
+        if estado:
+            query = query.filter(Booking.estado == estado)
+
+        return keyset_response(query, Booking.id, fila_to_dict)
 
     @app.route("/bookings/<int:booking_id>", methods=["GET"])
     def get_booking(booking_id):
@@ -1744,6 +3059,22 @@ def create_app():
                 membership.estado = "Inactiva"
                 db.session.add(membership)
                 db.session.commit()  # persist the state change even if we reject the booking
+
+        # Desde aquí y hasta el commit, la sesión (y la membresía) quedan
+        # bloqueadas: las reservas concurrentes de la misma clase o con la
+        # misma membresía esperan su turno, así los conteos de abajo no
+        # pueden quedar desactualizados. Siempre sesión -> membresía, para
+        # que dos reservas nunca tomen los bloqueos en orden inverso.
+        session_obj = bloquear_fila(ClassSession, session_id)
+        if membership:
+            membership = bloquear_fila(Membership, membership.id)
+
+        # Validación de cupo de la clase
+        ocupa_cupo = estado not in Booking.ESTADOS_SIN_CUPO
+        if ocupa_cupo and (session_obj.reservadas or 0) >= session_obj.capacidad:
+            return jsonify({"error": "la clase está llena"}), 400
+
+        if membership:
             if membership.estado != "Activa":
                 return jsonify({"error": "la membresía no está activa"}), 400
 
@@ -1792,6 +3123,8 @@ def create_app():
             check_in_at=parse_iso_datetime(data.get("check_in_at")) if data.get("check_in_at") else None,
         )
         db.session.add(b)
+        if ocupa_cupo:
+            ajustar_reservadas(session_obj.id, 1)
         try:
             db.session.commit()
         except Exception as exc:
@@ -1803,10 +3136,18 @@ def create_app():
     def update_booking(booking_id):
         b = Booking.query.get_or_404(booking_id)
         data = request.get_json() or {}
+        sesion_anterior = b.session_id
+        ocupaba_cupo = b.estado not in Booking.ESTADOS_SIN_CUPO
         if "session_id" in data:
-            if not ClassSession.query.get(data["session_id"]):
+            # int antes de bloquear: los ids se ordenan junto con
+            # sesion_anterior y un "2" del JSON no se compara con un int
+            try:
+                session_id = int(data["session_id"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "session_id no válido"}), 400
+            if not ClassSession.query.get(session_id):
                 return jsonify({"error": "session_id no válido"}), 400
-            b.session_id = data["session_id"]
+            b.session_id = session_id
         if "client_id" in data:
             if not Client.query.get(data["client_id"]):
                 return jsonify({"error": "client_id no válido"}), 400
@@ -1821,12 +3162,32 @@ def create_app():
             b.asistio = bool(data["asistio"])
         if "check_in_at" in data:
             b.check_in_at = parse_iso_datetime(data["check_in_at"]) if data["check_in_at"] else None
+
+        # Mantener ClassSession.reservadas si cambió la clase o si el
+        # nuevo estado libera/ocupa cupo
+        ocupa_cupo = b.estado not in Booking.ESTADOS_SIN_CUPO
+        if (sesion_anterior, ocupaba_cupo) != (b.session_id, ocupa_cupo):
+            # Bloqueo en orden de id, igual que create_booking
+            sesiones = {
+                sid: bloquear_fila(ClassSession, sid)
+                for sid in sorted({sesion_anterior, b.session_id})
+            }
+            if ocupa_cupo:
+                destino = sesiones[b.session_id]
+                if (destino.reservadas or 0) >= destino.capacidad:
+                    return jsonify({"error": "la clase está llena"}), 400
+                ajustar_reservadas(b.session_id, 1)
+            if ocupaba_cupo:
+                ajustar_reservadas(sesion_anterior, -1)
+
         db.session.commit()
         return jsonify(b.to_dict())
 
     @app.route("/bookings/<int:booking_id>", methods=["DELETE"])
     def delete_booking(booking_id):
         b = Booking.query.get_or_404(booking_id)
+        if b.estado not in Booking.ESTADOS_SIN_CUPO:
+            ajustar_reservadas(b.session_id, -1)
         db.session.delete(b)
         db.session.commit()
         return jsonify({"message": "Booking eliminado"})
@@ -1835,14 +3196,40 @@ def create_app():
 
     @app.route("/account-movements", methods=["GET"])
     def list_account_movements():
-        records = AccountMovement.query.order_by(AccountMovement.creado_en.desc()).all()
-        return jsonify([m.to_dict() for m in records])
+        """
+        Lista movimientos con sus pagos (precargados en una sola consulta).
+        Opcional: ?payments=0 para omitir los pagos.
+        """
+        incluir = incluir_payments()
+        query = AccountMovement.query
+        if incluir:
+            query = query.options(selectinload(AccountMovement.payments))
+        return keyset_response(
+            query,
+            AccountMovement.creado_en,
+            lambda m: m.to_dict(include_payments=incluir),
+            descending=True,
+            streamable=True,
+        )
 
     @app.route("/account-movements/<int:movement_id>", methods=["GET"])
     def get_account_movement(movement_id):
         m = AccountMovement.query.get_or_404(movement_id)
         return jsonify(m.to_dict())
 
+    # Mismas claves que Payment.to_dict, leídas como filas (sin instancias ORM)
+    PAYMENT_COLUMNAS = (
+        Payment.id,
+        Payment.client_id,
+        Payment.movement_id,
+        Payment.membership_id,
+        Payment.payment_type,
+        Payment.amount,
+        Payment.payment_method,
+        Payment.payment_reference,
+        Payment.fecha_pago,
+    )
+
     @app.route("/payments", methods=["GET"])
     def list_payments():
         """
@@ -1850,10 +3237,12 @@ def create_app():
         Query params:
           - inicio: fecha ISO (e.g., 2025-01-01 o 2025-01-01T00:00:00Z)
           - fin:    fecha ISO (e.g., 2025-01-31 o 2025-01-31T23:59:59Z)
+          - limit / after: paginación por cursor (ver keyset_response)
+          - stream: json | ndjson para exportar en streaming
         """
         inicio_str = request.args.get("inicio")
         fin_str = request.args.get("fin")
-        query = Payment.query
+        query = db.session.query(*PAYMENT_COLUMNAS)
         try:
             if inicio_str:
                 inicio_date = parse_iso_date(inicio_str)
@@ -1865,8 +3254,9 @@ def create_app():
                 query = query.filter(Payment.fecha_pago <= fin_dt)
         except ValueError:
             return jsonify({"error": "inicio/fin deben ser fechas ISO válidas"}), 400
-        records = query.order_by(Payment.fecha_pago.desc()).all()
-        return jsonify([p.to_dict() for p in records])
+        return keyset_response(
+            query, Payment.fecha_pago, fila_to_dict, descending=True, streamable=True
+        )
 
     @app.route("/account-movements", methods=["POST"])
     def create_account_movement():
@@ -1932,6 +3322,173 @@ def create_app():
         db.session.commit()
         return jsonify(movement.to_dict()), 201
     
+    # ---------- CLI ----------
+
+    @app.cli.command("backfill-imagen-hash")
+    def backfill_imagen_hash():
+        """Calcula imagen_hash para productos que tienen imagen pero no hash."""
+        query = Producto.query.filter(
+            Producto.imagen.isnot(None),
+            Producto.imagen != "",
+            Producto.imagen_hash.is_(None),
+        )
+        total = 0
+        while True:
+            # Por lotes para no tener todas las imágenes en memoria a la vez
+            lote = query.limit(200).all()
+            if not lote:
+                break
+            for p in lote:
+                p.imagen_hash = hashlib.sha256(p.imagen.encode("utf-8")).hexdigest()
+            db.session.commit()
+            total += len(lote)
+        click.echo(f"{total} productos actualizados")
+
+    @app.cli.command("recalcular-reservadas")
+    def recalcular_reservadas():
+        """Recalcula ClassSession.reservadas a partir de bookings (un solo UPDATE)."""
+        ocupados = (
+            db.session.query(func.count(Booking.id))
+            .filter(
+                Booking.session_id == ClassSession.id,
+                Booking.estado.notin_(Booking.ESTADOS_SIN_CUPO),
+            )
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            update(ClassSession)
+            .where(ClassSession.reservadas != ocupados)
+            .values(reservadas=ocupados)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        click.echo(f"{result.rowcount} clases corregidas")
+
+    @app.cli.command("crear-checkpoints")
+    @click.option("--min-movimientos", default=50, show_default=True,
+                  help="Movimientos nuevos necesarios para crear un checkpoint.")
+    @click.option("--margen-minutos", default=10, show_default=True,
+                  help="Solo se cubren movimientos creados hace al menos este tiempo.")
+    def crear_checkpoints(min_movimientos, margen_minutos):
+        """
+        Crea un BalanceCheckpoint por cliente con suficientes movimientos nuevos.
+
+        El ledger toma como cubiertos todos los movimientos con id <= el del
+        checkpoint, pero los ids se asignan al insertar y no al confirmar: un
+        movimiento con id menor puede aparecer después. Por eso cada
+        checkpoint llega solo hasta el último movimiento creado antes de
+        now() - margen (hora de la BD) y suma exactamente ese rango de ids;
+        el margen tiene que superar la transacción más larga que crea
+        movimientos y el desfase de reloj de los servidores de la app.
+        """
+        corte = ahora_bd() - timedelta(minutes=margen_minutos)
+        ultimo = (
+            db.session.query(
+                BalanceCheckpoint.client_id,
+                func.max(BalanceCheckpoint.movement_id).label("movement_id"),
+            )
+            .group_by(BalanceCheckpoint.client_id)
+            .subquery()
+        )
+        # Último movimiento anterior al corte por cliente: fin del rango
+        limite = (
+            db.session.query(
+                AccountMovement.client_id,
+                func.max(AccountMovement.id).label("movement_id"),
+            )
+            .filter(AccountMovement.creado_en < corte)
+            .group_by(AccountMovement.client_id)
+            .subquery()
+        )
+        previo = db.aliased(BalanceCheckpoint)
+        filas = (
+            db.session.query(
+                AccountMovement.client_id,
+                func.coalesce(func.max(previo.saldo), 0) + func.sum(AccountMovement.amount),
+                func.max(AccountMovement.id),
+            )
+            .join(limite, limite.c.client_id == AccountMovement.client_id)
+            .outerjoin(ultimo, ultimo.c.client_id == AccountMovement.client_id)
+            .outerjoin(
+                previo,
+                (previo.client_id == ultimo.c.client_id) & (previo.movement_id == ultimo.c.movement_id),
+            )
+            .filter(
+                AccountMovement.id > func.coalesce(ultimo.c.movement_id, 0),
+                AccountMovement.id <= limite.c.movement_id,
+            )
+            .group_by(AccountMovement.client_id)
+            .having(func.count(AccountMovement.id) >= min_movimientos)
+            .all()
+        )
+        if filas:
+            db.session.execute(
+                insert(BalanceCheckpoint),
+                [
+                    {"client_id": client_id, "saldo": saldo, "movement_id": movement_id}
+                    for client_id, saldo, movement_id in filas
+                ],
+            )
+        db.session.commit()
+        click.echo(f"{len(filas)} checkpoints creados")
+
+    @app.cli.command("reconciliar-saldos")
+    @click.option("--fix", is_flag=True, help="Corrige los saldos que no cuadran.")
+    @click.option("--batch-size", default=500, show_default=True,
+                  help="Clientes corregidos por transacción.")
+    def reconciliar_saldos(fix, batch_size):
+        """
+        Compara Client.saldo con la suma de sus AccountMovement (una sola
+        consulta agrupada) y, con --fix, corrige las diferencias por lotes.
+        """
+        totales = (
+            db.session.query(
+                AccountMovement.client_id,
+                func.sum(AccountMovement.amount).label("total"),
+            )
+            .group_by(AccountMovement.client_id)
+            .subquery()
+        )
+        esperado = func.coalesce(totales.c.total, 0)
+        diferencias = (
+            db.session.query(Client.id, Client.nombre, Client.saldo, esperado)
+            .outerjoin(totales, totales.c.client_id == Client.id)
+            .filter(Client.saldo != esperado)
+            .order_by(Client.id)
+            .all()
+        )
+
+        for client_id, nombre, saldo, total in diferencias:
+            click.echo(f"client {client_id} ({nombre}): saldo={saldo} movimientos={total}", err=True)
+        click.echo(f"{len(diferencias)} saldos no cuadran")
+        if not fix or not diferencias:
+            return
+
+        # El valor se recalcula dentro del UPDATE, así un movimiento que
+        # entre mientras corre el comando no se pierde
+        suma_movimientos = (
+            db.session.query(func.coalesce(func.sum(AccountMovement.amount), 0))
+            .filter(AccountMovement.client_id == Client.id)
+            .scalar_subquery()
+        )
+        ids = [row[0] for row in diferencias]
+        for i in range(0, len(ids), batch_size):
+            db.session.execute(
+                update(Client)
+                .where(Client.id.in_(ids[i:i + batch_size]))
+                .values(saldo=suma_movimientos)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        click.echo(f"{len(ids)} saldos corregidos")
+
+    @app.cli.command("refrescar-rollups")
+    @click.option("--completo", is_flag=True, help="Recalcula todo el historial.")
+    def refrescar_rollups_cmd(completo):
+        """Actualiza los rollups diarios del dashboard (días modificados desde el último refresco)."""
+        dias_pagos, dias_clases = refrescar_rollups(completo=completo)
+        click.echo(f"rollups actualizados: {dias_pagos} días de pagos, {dias_clases} días de clases")
+
     prefix = app.config.get("URL_PREFIX", "/marehpilates")
     if prefix:
         # Montar la app bajo un prefijo (por ejemplo /coproda)
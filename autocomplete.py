@@ -0,0 +1,200 @@
+import re
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+
+_PALABRA = re.compile(r"\w+")
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'López' -> 'lopez'."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokens(texto, telefono=False):
+    """
+    Palabras normalizadas del texto. Para teléfonos agrega además todos los
+    dígitos juntos, así '5555 1111' se encuentra con '5555' o con '55551111'.
+    """
+    palabras = _PALABRA.findall(normalizar(texto))
+    if telefono:
+        digitos = "".join(p for p in palabras if p.isdigit())
+        if digitos:
+            palabras.append(digitos)
+    return set(palabras)
+
+
+class _Nodo:
+    __slots__ = ("hijos", "ids")
+
+    def __init__(self):
+        self.hijos = {}
+        self.ids = set()
+
+
+class PrefixIndex:
+    """
+    Índice en memoria (por proceso) para autocomplete: trie de las palabras
+    de `campos` (y de los dígitos de `telefonos`) de un modelo.
+
+    Se carga en el primer uso, se actualiza al hacer commit de altas,
+    cambios y bajas del modelo (listeners al final del módulo) y se
+    reconstruye cada `ttl` segundos para recoger lo que escriban otros workers.
+    """
+
+    def __init__(self, model, campos, telefonos=(), extra=(), ttl=600):
+        self.model = model
+        self.campos = tuple(campos)
+        self.telefonos = tuple(telefonos)
+        self.columnas = ("id",) + self.campos + self.telefonos + tuple(extra)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._raiz = None
+        self._docs = {}
+        self._tokens = {}
+        self._loaded_at = 0.0
+
+    def _tokens_doc(self, doc):
+        result = set()
+        for campo in self.campos:
+            result |= tokens(doc.get(campo))
+        for campo in self.telefonos:
+            result |= tokens(doc.get(campo), telefono=True)
+        return result
+
+    def _insertar(self, doc):
+        self._quitar(doc["id"])
+        toks = self._tokens_doc(doc)
+        for tok in toks:
+            nodo = self._raiz
+            for c in tok:
+                nodo = nodo.hijos.setdefault(c, _Nodo())
+            nodo.ids.add(doc["id"])
+        self._docs[doc["id"]] = doc
+        self._tokens[doc["id"]] = toks
+
+    def _quitar(self, doc_id):
+        for tok in self._tokens.pop(doc_id, ()):
+            nodo = self._raiz
+            for c in tok:
+                nodo = nodo.hijos.get(c)
+                if nodo is None:
+                    break
+            else:
+                nodo.ids.discard(doc_id)
+        self._docs.pop(doc_id, None)
+
+    def warm(self):
+        """(Re)construye el índice desde la BD."""
+        columnas = [getattr(self.model, c) for c in self.columnas]
+        rows = db.session.query(*columnas).all()
+        with self._lock:
+            self._raiz = _Nodo()
+            self._docs = {}
+            self._tokens = {}
+            for row in rows:
+                self._insertar(dict(zip(self.columnas, row)))
+            self._loaded_at = time.monotonic()
+
+    def _asegurar_cargado(self):
+        with self._lock:
+            vigente = self._raiz is not None and time.monotonic() - self._loaded_at <= self.ttl
+        if not vigente:
+            self.warm()
+
+    def upsert(self, doc):
+        with self._lock:
+            if self._raiz is not None:
+                self._insertar(doc)
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._raiz is not None:
+                self._quitar(doc_id)
+
+    def search(self, q, k=10):
+        """
+        Hasta k documentos en los que cada palabra de q es prefijo de alguna
+        de sus palabras. Recorre el trie en orden alfabético y corta al
+        llegar a k, así que el costo depende de k y no del total de filas.
+        """
+        toks = sorted(tokens(q), key=len, reverse=True)
+        if not toks:
+            return []
+        self._asegurar_cargado()
+        with self._lock:
+            # Se recorre la palabra más larga (la más selectiva) y se
+            # filtra por las demás
+            nodo = self._raiz
+            for c in toks[0]:
+                nodo = nodo.hijos.get(c)
+                if nodo is None:
+                    return []
+            resto = toks[1:]
+            vistos = set()
+            result = []
+            pila = [nodo]
+            while pila and len(result) < k:
+                nodo = pila.pop()
+                for doc_id in sorted(nodo.ids - vistos):
+                    vistos.add(doc_id)
+                    doc_toks = self._tokens[doc_id]
+                    if all(any(t.startswith(r) for t in doc_toks) for r in resto):
+                        result.append(dict(self._docs[doc_id]))
+                        if len(result) == k:
+                            break
+                pila.extend(nodo.hijos[c] for c in sorted(nodo.hijos, reverse=True))
+            return result
+
+
+_indices = {}
+
+
+def init_autocomplete(app, definiciones):
+    """
+    Crea un PrefixIndex por modelo si AUTOCOMPLETE_INDEX está activo.
+    definiciones: {modelo: dict(campos=..., telefonos=..., extra=...)}.
+    Devuelve el dict {modelo: índice} (vacío si está desactivado).
+    """
+    if not app.config.get("AUTOCOMPLETE_INDEX", True):
+        return {}
+    ttl = app.config.get("AUTOCOMPLETE_TTL", 600)
+    for model, opciones in definiciones.items():
+        _indices[model] = PrefixIndex(model, ttl=ttl, **opciones)
+    app.extensions["autocomplete"] = _indices
+    return _indices
+
+
+@event.listens_for(Session, "after_flush")
+def _track_autocomplete_changes(session, flush_context):
+    if not _indices:
+        return
+    pendientes = session.info.setdefault("autocomplete_pendientes", {})
+    for obj in list(session.new) + list(session.dirty):
+        index = _indices.get(type(obj))
+        if index is not None:
+            doc = {c: getattr(obj, c) for c in index.columnas}
+            pendientes[(type(obj), obj.id)] = doc
+    for obj in session.deleted:
+        if type(obj) in _indices:
+            pendientes[(type(obj), obj.id)] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_autocomplete_changes(session):
+    for (model, doc_id), doc in session.info.pop("autocomplete_pendientes", {}).items():
+        if doc is None:
+            _indices[model].remove(doc_id)
+        else:
+            _indices[model].upsert(doc)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_autocomplete_changes(session):
+    session.info.pop("autocomplete_pendientes", None)
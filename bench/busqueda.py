@@ -0,0 +1,184 @@
+"""
+Benchmark de /clientes/buscar y /productos/buscar contra Postgres.
+
+Siembra N clientes y N productos (100k por defecto), hace VACUUM ANALYZE,
+muestra el EXPLAIN (ANALYZE, BUFFERS) de la consulta de cada búsqueda y mide
+la latencia de los endpoints con el test client de Flask. Las filas
+sembradas se borran al terminar (salvo --conservar).
+
+    DATABASE_URL=postgresql+psycopg2://usuario@host/bd_pruebas \\
+        python bench/busqueda.py [--filas 100000] [--repeticiones 20]
+
+Usar una BD de pruebas: crea las tablas que falten (db.create_all(), que
+también crea la extensión pg_trgm). Los tiempos dependen del servidor:
+al citarlos, pegar la salida completa (empieza con SELECT version()).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import delete, event, insert, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import (  # noqa: E402
+    db,
+    CategoriaProducto,
+    Cliente,
+    MarcaProducto,
+    Producto,
+    Talla,
+    Tienda,
+)
+
+NOMBRES = [
+    "María", "José", "Ana", "Luis", "Carmen", "Jorge", "Lucía", "Carlos",
+    "Sofía", "Miguel", "Elena", "Pedro", "Valeria", "Andrés", "Paola", "Diego",
+]
+APELLIDOS = [
+    "García", "López", "Martínez", "Rodríguez", "Pérez", "González", "Sánchez",
+    "Ramírez", "Flores", "Morales", "Castillo", "Herrera", "Mendoza", "Ortiz",
+    "Aguilar", "Juárez", "Méndez", "Cruz", "Reyes", "Vásquez",
+]
+PRENDAS = ["Malla", "Leggings", "Top", "Calcetas", "Sudadero", "Short", "Toalla", "Botella"]
+ADJETIVOS = ["deportiva", "antideslizante", "térmica", "ligera", "acolchada", "reforzada"]
+COLORES = ["negro", "blanco", "gris", "azul", "rosa", "verde", "morado"]
+
+DOMINIO = "bench.invalid"
+PREFIJO_SKU = "BENCH-"
+LOTE = 5000
+
+BUSQUEDAS = [
+    ("/clientes/buscar", "maría"),             # nombre frecuente
+    ("/clientes/buscar", "vásquez aguilar"),   # combinación poco frecuente
+    ("/clientes/buscar", "5512"),              # fragmento de teléfono
+    ("/productos/buscar", "malla"),            # prenda frecuente
+    ("/productos/buscar", "BENCH-00421"),      # SKU casi exacto
+    ("/productos/buscar", "toallas térmicas"), # otra flexión (full-text)
+]
+
+
+def sembrar(filas, rnd):
+    tienda = Tienda(nombre="Bench")
+    marca = MarcaProducto(nombre="Bench")
+    categoria = CategoriaProducto(nombre="Bench")
+    talla = Talla(nombre="Bench")
+    db.session.add_all([tienda, marca, categoria, talla])
+    db.session.flush()
+
+    for inicio in range(0, filas, LOTE):
+        clientes = []
+        productos = []
+        for i in range(inicio, min(inicio + LOTE, filas)):
+            nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+            clientes.append({
+                "nombre": nombre,
+                "telefono": f"5{rnd.randrange(10**7):07d}",
+                "email": f"cliente{i}@{DOMINIO}",
+                "nit": f"{rnd.randrange(10**8):08d}",
+            })
+            productos.append({
+                "sku": f"{PREFIJO_SKU}{i:06d}",
+                "descripcion": (
+                    f"{rnd.choice(PRENDAS)} {rnd.choice(ADJETIVOS)} {rnd.choice(COLORES)}"
+                ),
+                "costo": 100,
+                "precio": 180,
+                "tienda_id": tienda.id,
+                "marca_id": marca.id,
+                "categoria_id": categoria.id,
+                "talla_id": talla.id,
+            })
+        db.session.execute(insert(Cliente), clientes)
+        db.session.execute(insert(Producto), productos)
+    db.session.commit()
+
+    # VACUUM además vacía la lista pendiente de los índices GIN: con las
+    # filas recién insertadas ahí el planner prefiere el Seq Scan
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for tabla in (Cliente.__tablename__, Producto.__tablename__):
+            conn.execute(text(f"VACUUM ANALYZE {tabla}"))
+
+
+def limpiar():
+    db.session.execute(delete(Producto).where(Producto.sku.startswith(PREFIJO_SKU)))
+    db.session.execute(delete(Cliente).where(Cliente.email.endswith("@" + DOMINIO)))
+    for model in (Tienda, MarcaProducto, CategoriaProducto, Talla):
+        db.session.execute(delete(model).where(model.nombre == "Bench"))
+    db.session.commit()
+
+
+def consulta_de_busqueda(client, path):
+    """(sentencia, parámetros) de la búsqueda que ejecuta una request."""
+    capturadas = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if "similarity(" in statement:
+            capturadas.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        client.get(path)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    return capturadas[-1]
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        filas = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+        return "\n".join(f"    {fila[0]}" for fila in filas)
+
+
+def medir(client, path, repeticiones):
+    client.get(path)  # calienta caches y planes
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resp = client.get(path)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert resp.status_code == 200, resp.get_data(as_text=True)
+    tiempos.sort()
+    p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+    return len(resp.get_json()), statistics.median(tiempos), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--conservar", action="store_true", help="no borra las filas sembradas")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL", "").startswith("postgresql"):
+        sys.exit("DATABASE_URL debe apuntar a una BD Postgres de pruebas")
+
+    app = create_app()
+    prefix = app.config.get("URL_PREFIX") or ""
+    with app.app_context():
+        # Para que la salida pegada en un commit/PR diga dónde se midió
+        print(db.session.scalar(text("SELECT version()")))
+        db.create_all()
+        inicio = time.perf_counter()
+        sembrar(args.filas, random.Random(42))
+        print(f"sembrados {args.filas} clientes y {args.filas} productos "
+              f"en {time.perf_counter() - inicio:.1f} s")
+        try:
+            client = app.test_client()
+            for endpoint, q in BUSQUEDAS:
+                path = f"{prefix}{endpoint}?q={q}"
+                filas, mediana, p95 = medir(client, path, args.repeticiones)
+                print(f"\n{endpoint}?q={q}: {filas} filas, "
+                      f"mediana {mediana:.1f} ms, p95 {p95:.1f} ms")
+                print(explain(*consulta_de_busqueda(client, path)))
+        finally:
+            if not args.conservar:
+                limpiar()
+
+
+if __name__ == "__main__":
+    main()
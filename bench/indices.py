@@ -0,0 +1,299 @@
+"""
+Consultas filtradas de reservas, sesiones, movimientos, pagos y órdenes con y
+sin los índices de FKs/fechas declarados en models.py.
+
+Siembra el dataset (SQLite en memoria, o DATABASE_URL con --bd), mide cada
+consulta con los índices, los borra (DROP INDEX), vuelve a medir y los crea
+de nuevo. Se reporta la mediana por consulta sobre --repeticiones corridas
+con parámetros distintos.
+
+    python bench/indices.py [--clientes 2000] [--dias 730] [--repeticiones 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, time as hora, timedelta
+
+from sqlalchemy import insert, select, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from app import create_app  # noqa: E402
+from models import (  # noqa: E402
+    db,
+    AccountMovement,
+    Booking,
+    ClassSession,
+    Client,
+    Cliente,
+    Coach,
+    Membership,
+    MembershipPlan,
+    Orden,
+    OrdenItem,
+    Payment,
+    Producto,
+    Tienda,
+)
+
+# Índices que se comparan (los de FKs y columnas de filtro)
+INDICES = [
+    "ix_class_sessions_fecha_hora",
+    "ix_bookings_membership_estado",
+    "ix_bookings_client_id",
+    "ix_memberships_client_id",
+    "ix_account_movements_client_creado",
+    "ix_account_movements_creado_en",
+    "ix_payments_client_id",
+    "ix_payments_membership_id",
+    "ix_payments_fecha_pago",
+    "ix_ordenes_fecha",
+    "ix_ordenes_cliente_id",
+    "ix_orden_items_orden_id",
+]
+
+INICIO = date(2024, 1, 1)
+SESIONES_POR_DIA = 6
+RESERVAS_POR_SESION = 12
+LOTE = 5000
+
+
+def insertar(model, filas):
+    for i in range(0, len(filas), LOTE):
+        db.session.execute(insert(model), filas[i:i + LOTE])
+
+
+def ids(model):
+    return db.session.scalars(select(model.id).order_by(model.id)).all()
+
+
+def sembrar(clientes, dias, rnd):
+    plan = MembershipPlan(nombre="Bench", precio=100, max_clases_por_semana=3)
+    coach = Coach(nombre="Bench", telefono="0")
+    tienda = Tienda(nombre="Bench")
+    db.session.add_all([plan, coach, tienda])
+    db.session.flush()
+
+    insertar(Client, [{"nombre": f"Client {i}", "telefono": str(i)} for i in range(clientes)])
+    client_ids = ids(Client)
+    insertar(Membership, [
+        {
+            "client_id": client_id,
+            "plan_id": plan.id,
+            "fecha_inicio": INICIO,
+            "fecha_fin": INICIO + timedelta(days=dias),
+            "estado": "Activa",
+        }
+        for client_id in client_ids
+    ])
+    membership_de = dict(db.session.execute(select(Membership.client_id, Membership.id)).all())
+
+    insertar(ClassSession, [
+        {
+            "fecha": INICIO + timedelta(days=d),
+            "hora_inicio": hora(7 + 2 * s),
+            "hora_fin": hora(8 + 2 * s),
+            "coach_id": coach.id,
+            "capacidad": RESERVAS_POR_SESION,
+            "reservadas": RESERVAS_POR_SESION,
+        }
+        for d in range(dias)
+        for s in range(SESIONES_POR_DIA)
+    ])
+    reservas = []
+    for session_id in ids(ClassSession):
+        for client_id in rnd.sample(client_ids, RESERVAS_POR_SESION):
+            reservas.append({
+                "session_id": session_id,
+                "client_id": client_id,
+                "membership_id": membership_de[client_id],
+                "estado": rnd.choice(["Reservada", "Completada", "Completada", "Cancelada"]),
+            })
+    insertar(Booking, reservas)
+
+    momento = lambda: datetime.combine(INICIO, hora()) + timedelta(  # noqa: E731
+        seconds=rnd.randrange(dias * 86400)
+    )
+    insertar(AccountMovement, [
+        {"client_id": rnd.choice(client_ids), "amount": 50, "tipo": "fine", "creado_en": momento()}
+        for _ in range(len(reservas) // 2)
+    ])
+    insertar(Payment, [
+        {
+            "client_id": client_id,
+            "membership_id": membership_de[client_id],
+            "amount": 100,
+            "payment_type": "membership",
+            "fecha_pago": momento(),
+        }
+        for client_id in (rnd.choice(client_ids) for _ in range(len(reservas) // 2))
+    ])
+
+    cliente = Cliente(nombre="Bench", telefono="0")
+    producto = Producto(tienda_id=tienda.id, descripcion="Bench", costo=1, precio=2)
+    db.session.add_all([cliente, producto])
+    db.session.flush()
+    insertar(Orden, [
+        {"codigo": f"B-{i}", "cliente_id": cliente.id, "fecha": momento()}
+        for i in range(len(reservas) // 3)
+    ])
+    insertar(OrdenItem, [
+        {"orden_id": orden_id, "producto_id": producto.id, "cantidad": 1, "precio_unitario": 2}
+        for orden_id in ids(Orden)
+        for _ in range(3)
+    ])
+    db.session.commit()
+    return client_ids, list(membership_de.values()), ids(Orden), len(reservas)
+
+
+def consultas(client_ids, membership_ids, orden_ids, dias):
+    """[(nombre, fn(rnd))]: las mismas consultas que arman las vistas."""
+    def dia(rnd):
+        return INICIO + timedelta(days=rnd.randrange(dias - 31))
+
+    def momento(rnd):
+        return datetime.combine(dia(rnd), hora())
+
+    def limite_semanal(rnd):
+        inicio = dia(rnd)
+        return (
+            Booking.query.join(ClassSession, Booking.session_id == ClassSession.id)
+            .filter(
+                Booking.membership_id == rnd.choice(membership_ids),
+                Booking.estado == "Reservada",
+                ClassSession.fecha >= inicio,
+                ClassSession.fecha <= inicio + timedelta(days=5),
+            )
+            .count()
+        )
+
+    def limite_total(rnd):
+        return Booking.query.filter(
+            Booking.membership_id == rnd.choice(membership_ids),
+            Booking.estado != "Completada",
+        ).count()
+
+    def sesiones_semana(rnd):
+        inicio = dia(rnd)
+        return (
+            ClassSession.query.filter(ClassSession.fecha.between(inicio, inicio + timedelta(days=6)))
+            .order_by(ClassSession.fecha, ClassSession.hora_inicio)
+            .all()
+        )
+
+    def reservas_cliente(rnd):
+        return Booking.query.filter(Booking.client_id == rnd.choice(client_ids)).all()
+
+    def estado_de_cuenta(rnd):
+        return (
+            AccountMovement.query.filter(
+                AccountMovement.client_id == rnd.choice(client_ids),
+                AccountMovement.creado_en >= momento(rnd),
+            )
+            .order_by(AccountMovement.creado_en)
+            .all()
+        )
+
+    def pagos_mes(rnd):
+        inicio = momento(rnd)
+        return Payment.query.filter(
+            Payment.fecha_pago >= inicio, Payment.fecha_pago < inicio + timedelta(days=30)
+        ).all()
+
+    def pagos_membresia(rnd):
+        return Payment.query.filter(Payment.membership_id == rnd.choice(membership_ids)).all()
+
+    def ventas_mes(rnd):
+        inicio = momento(rnd)
+        return Orden.query.filter(
+            Orden.fecha >= inicio, Orden.fecha < inicio + timedelta(days=30)
+        ).all()
+
+    def items_orden(rnd):
+        return OrdenItem.query.filter(OrdenItem.orden_id == rnd.choice(orden_ids)).all()
+
+    return [
+        ("create_booking: límite semanal", limite_semanal),
+        ("create_booking: límite total", limite_total),
+        ("/class-sessions de una semana", sesiones_semana),
+        ("/bookings?client_id=", reservas_cliente),
+        ("ledger: movimientos de un cliente", estado_de_cuenta),
+        ("pagos de 30 días (fecha_pago)", pagos_mes),
+        ("pagos de una membresía", pagos_membresia),
+        ("ventas de 30 días (Orden.fecha)", ventas_mes),
+        ("items de una orden", items_orden),
+    ]
+
+
+def medir(fn, repeticiones):
+    rnd = random.Random(7)  # mismos parámetros con y sin índices
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn(rnd)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.session.expunge_all()
+    return statistics.median(tiempos)
+
+
+def analizar():
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clientes", type=int, default=2000)
+    parser.add_argument("--dias", type=int, default=730)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--bd", action="store_true", help="usa DATABASE_URL (BD de pruebas) en vez de SQLite")
+    args = parser.parse_args()
+
+    if not args.bd:
+        config.Config.SQLALCHEMY_DATABASE_URI = "sqlite://"
+        config.Config.SQLALCHEMY_ENGINE_OPTIONS = config._engine_options("sqlite://")
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        indices = [
+            index
+            for table in db.metadata.sorted_tables
+            for index in table.indexes
+            if index.name in INDICES
+        ]
+        faltan = set(INDICES) - {index.name for index in indices}
+        assert not faltan, f"índices no declarados en models.py: {sorted(faltan)}"
+
+        inicio = time.perf_counter()
+        client_ids, membership_ids, orden_ids, reservas = sembrar(
+            args.clientes, args.dias, random.Random(42)
+        )
+        print(f"{db.engine.dialect.name}: {args.clientes} clients, "
+              f"{args.dias * SESIONES_POR_DIA} sesiones, {reservas} reservas, "
+              f"{reservas // 2} movimientos y pagos, {len(orden_ids)} órdenes "
+              f"(sembrado en {time.perf_counter() - inicio:.1f} s)")
+
+        lista = consultas(client_ids, membership_ids, orden_ids, args.dias)
+        analizar()
+        con = [medir(fn, args.repeticiones) for _, fn in lista]
+        for index in indices:
+            index.drop(bind=db.engine)
+        analizar()
+        try:
+            sin = [medir(fn, args.repeticiones) for _, fn in lista]
+        finally:
+            for index in indices:
+                index.create(bind=db.engine)
+
+        print(f"\n{'consulta':36} {'sin índices':>12} {'con índices':>12}")
+        for (nombre, _), ms_sin, ms_con in zip(lista, sin, con):
+            print(f"{nombre:36} {ms_sin:9.2f} ms {ms_con:9.2f} ms  ({ms_sin / ms_con:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Costo de serializar y comprimir los listados grandes (/productos, /ordenes).
+
+Siembra productos y órdenes en SQLite en memoria (o en DATABASE_URL si se
+pasa --bd), pide cada listado sin comprimir y mide por separado:
+json de la stdlib vs orjson (FastJSONProvider) y gzip vs brotli con los
+niveles de COMPRESS_GZIP_LEVEL / COMPRESS_BROTLI_QUALITY. Se reporta el
+mínimo de --repeticiones corridas, que es lo menos sensible al ruido.
+
+    python bench/respuestas.py [--productos 2000] [--ordenes 3000]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import json_provider  # noqa: E402
+from app import create_app  # noqa: E402
+from compression import brotli  # noqa: E402
+from models import db, Cliente, Orden, OrdenItem, Producto, Tienda  # noqa: E402
+
+
+def sembrar(productos, ordenes):
+    tienda = Tienda(nombre="Bench")
+    cliente = Cliente(nombre="Bench", telefono="0")
+    db.session.add_all([tienda, cliente])
+    db.session.flush()
+    filas = [
+        Producto(
+            tienda_id=tienda.id,
+            sku=f"BENCH-{i:06d}",
+            descripcion=f"Producto {i} malla deportiva",
+            costo=100,
+            precio=180,
+        )
+        for i in range(productos)
+    ]
+    db.session.add_all(filas)
+    db.session.flush()
+    for i in range(ordenes):
+        orden = Orden(codigo=f"BENCH-{i}", cliente_id=cliente.id, fecha=datetime(2025, 1, 1))
+        for producto in filas[i % 100:i % 100 + 3]:
+            orden.items.append(OrdenItem(producto_id=producto.id, cantidad=1, precio_unitario=180))
+        db.session.add(orden)
+    db.session.commit()
+
+
+def minimo(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--productos", type=int, default=2000)
+    parser.add_argument("--ordenes", type=int, default=3000)
+    parser.add_argument("--repeticiones", type=int, default=30)
+    parser.add_argument("--bd", action="store_true", help="usa DATABASE_URL en vez de SQLite")
+    args = parser.parse_args()
+
+    if not args.bd:
+        config.Config.SQLALCHEMY_DATABASE_URI = "sqlite://"
+        config.Config.SQLALCHEMY_ENGINE_OPTIONS = config._engine_options("sqlite://")
+    app = create_app()
+    prefix = app.config.get("URL_PREFIX") or ""
+    gzip_level = app.config.get("COMPRESS_GZIP_LEVEL", 6)
+    brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", 4)
+    orjson = json_provider.orjson
+
+    with app.app_context():
+        db.create_all()
+        sembrar(args.productos, args.ordenes)
+        client = app.test_client()
+        for endpoint in ("/productos", "/ordenes"):
+            raw = client.get(prefix + endpoint, headers={"Accept-Encoding": "identity"}).get_data()
+            data = json.loads(raw)
+            print(f"{endpoint}: {len(data)} filas, {len(raw) / 1024:.0f} KiB")
+
+            json_provider.orjson = None
+            stdlib = minimo(lambda: app.json.dumps(data), args.repeticiones)
+            json_provider.orjson = orjson
+            if orjson is not None:
+                rapido = minimo(lambda: app.json.dumps(data), args.repeticiones)
+                print(f"  json stdlib {stdlib:.1f} ms, orjson {rapido:.1f} ms "
+                      f"({stdlib / rapido:.1f}x)")
+            else:
+                print(f"  json stdlib {stdlib:.1f} ms (orjson no instalado)")
+
+            comprimido = gzip.compress(raw, compresslevel=gzip_level)
+            ms = minimo(lambda: gzip.compress(raw, compresslevel=gzip_level), args.repeticiones)
+            print(f"  gzip-{gzip_level} {ms:.1f} ms -> {len(comprimido) / 1024:.1f} KiB")
+            if brotli is not None:
+                comprimido = brotli.compress(raw, quality=brotli_quality)
+                ms = minimo(lambda: brotli.compress(raw, quality=brotli_quality), args.repeticiones)
+                print(f"  br-{brotli_quality} {ms:.1f} ms -> {len(comprimido) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
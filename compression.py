@@ -0,0 +1,105 @@
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se negocia gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = formato gzip
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class Compression:
+    """
+    Comprime las respuestas según Accept-Encoding (br si está el paquete
+    brotli, si no gzip).
+
+    Solo comprime tipos de texto/JSON de al menos COMPRESS_MIN_SIZE bytes;
+    las respuestas en streaming se comprimen por partes sin armarlas en
+    memoria. El ETag pasa a ser débil porque el cuerpo ya no es el mismo
+    byte a byte.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("COMPRESS_ENABLED", True)
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", 500)
+        self.gzip_level = app.config.get("COMPRESS_GZIP_LEVEL", 6)
+        self.brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", 4)
+        self.encodings = (["br"] if brotli is not None else []) + ["gzip"]
+        app.after_request(self._after_request)
+        app.extensions["compression"] = self
+
+    def _after_request(self, response):
+        if not self.enabled or request.method == "HEAD":
+            return response
+        response.vary.add("Accept-Encoding")
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            if response.direct_passthrough:
+                return response
+            chunks = response.response
+            if encoding == "br":
+                response.response = _brotli_stream(chunks, self.brotli_quality)
+            else:
+                response.response = _gzip_stream(chunks, self.gzip_level)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            if encoding == "br":
+                data = brotli.compress(data, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(data, compresslevel=self.gzip_level)
+            response.set_data(data)
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,186 @@
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+
+def pool_stats(engine):
+    """Estado del pool de conexiones (solo los contadores que el pool expone)."""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    for nombre in ("size", "checkedin", "checkedout", "overflow"):
+        metodo = getattr(pool, nombre, None)
+        if callable(metodo):
+            stats[nombre] = metodo()
+    return stats
+
+
+def check_database(engine):
+    """
+    Ejecuta SELECT 1 con una conexión del pool.
+    Devuelve (ok, latencia_ms, error).
+    """
+    inicio = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as exc:
+        return False, (time.perf_counter() - inicio) * 1000, str(exc)
+    return True, (time.perf_counter() - inicio) * 1000, None
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_lines(nombre, tipo, ayuda, muestras):
+    """
+    Formato de texto de Prometheus para una métrica.
+    muestras: lista de (labels dict, valor).
+    """
+    lines = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+    for labels, valor in muestras:
+        if labels:
+            etiquetas = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f"{nombre}{{{etiquetas}}} {valor}")
+        else:
+            lines.append(f"{nombre} {valor}")
+    return lines
+
+
+# Buckets por defecto: segundos para latencias, cantidad para queries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Histograma acumulativo estilo Prometheus, por combinación de labels."""
+
+    def __init__(self, nombre, ayuda, buckets, label_names):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [conteos por bucket, suma, total]
+
+    def observe(self, labels, valor):
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def lines(self):
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        muestras = []
+        for labels, (conteos, suma, total) in sorted(series.items()):
+            base = dict(zip(self.label_names, labels))
+            for limite, conteo in zip(self.buckets, conteos):
+                muestras.append((f"{self.nombre}_bucket", {**base, "le": limite}, conteo))
+            muestras.append((f"{self.nombre}_bucket", {**base, "le": "+Inf"}, total))
+            muestras.append((f"{self.nombre}_sum", base, suma))
+            muestras.append((f"{self.nombre}_count", base, total))
+
+        lines = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for nombre, labels, valor in muestras:
+            etiquetas = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f"{nombre}{{{etiquetas}}} {valor}" if etiquetas else f"{nombre} {valor}")
+        return lines
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_inicio(conn, cursor, statement, parameters, context, executemany):
+    conn.info["_sql_inicio"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_fin(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("_sql_inicio", None)
+    # Solo se mide dentro de un request (no en comandos CLI)
+    if inicio is not None and has_app_context() and "_sql_queries" in g:
+        g._sql_queries += 1
+        g._sql_segundos += time.perf_counter() - inicio
+
+
+class RequestMetrics:
+    """
+    Por endpoint: tiempo total, cantidad de queries SQL y tiempo en SQL.
+
+    Guarda histogramas en memoria (por proceso), agrega el header
+    Server-Timing y loguea los requests que superan SLOW_REQUEST_MS o
+    SLOW_REQUEST_QUERIES.
+    """
+
+    def __init__(self, app=None):
+        self.duracion = Histogram(
+            "http_request_duration_seconds",
+            "Duración de los requests.",
+            LATENCY_BUCKETS,
+            ("endpoint", "method", "status"),
+        )
+        self.queries = Histogram(
+            "http_request_db_queries",
+            "Queries SQL por request.",
+            QUERY_BUCKETS,
+            ("endpoint", "method"),
+        )
+        self.db_duracion = Histogram(
+            "http_request_db_duration_seconds",
+            "Tiempo en SQL por request.",
+            LATENCY_BUCKETS,
+            ("endpoint", "method"),
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_ms = app.config.get("SLOW_REQUEST_MS", 500)
+        self.slow_queries = app.config.get("SLOW_REQUEST_QUERIES", 20)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions["request_metrics"] = self
+
+    def _before_request(self):
+        g._request_inicio = time.perf_counter()
+        g._sql_queries = 0
+        g._sql_segundos = 0.0
+
+    def _after_request(self, response):
+        if "_request_inicio" not in g:
+            return response
+        total = time.perf_counter() - g._request_inicio
+        queries, sql = g._sql_queries, g._sql_segundos
+        # El endpoint (no la URL) evita una serie por cada id
+        endpoint = request.endpoint or "sin_ruta"
+        method = request.method
+
+        self.duracion.observe((endpoint, method, str(response.status_code)), total)
+        self.queries.observe((endpoint, method), queries)
+        self.db_duracion.observe((endpoint, method), sql)
+
+        response.headers["Server-Timing"] = (
+            f'db;dur={sql * 1000:.1f};desc="{queries} queries", app;dur={total * 1000:.1f}'
+        )
+        if total * 1000 >= self.slow_ms or queries >= self.slow_queries:
+            current_app.logger.warning(
+                "Request lento: %s %s (%s) %d -> %.1f ms, %d queries, %.1f ms en SQL",
+                method,
+                request.full_path.rstrip("?"),
+                endpoint,
+                response.status_code,
+                total * 1000,
+                queries,
+                sql * 1000,
+            )
+        return response
+
+    def lines(self):
+        return self.duracion.lines() + self.queries.lines() + self.db_duracion.lines()
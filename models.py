@@ -1,13 +1,65 @@
 from datetime import datetime
+import hashlib
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Numeric, text
+from sqlalchemy import DDL, Numeric, event, func, text
+from sqlalchemy.orm import deferred, validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+# El esquema (tablas, columnas e índices) se declara solo aquí y el repo no
+# versiona migrations/: al desplegar cambios de esquema hay que generar y
+# aplicar la migración con `flask db migrate` y `flask db upgrade` (con
+# `flask db init` la primera vez). En Postgres, para tablas grandes conviene
+# cambiar en la migración generada op.create_index(...) por
+# postgresql_concurrently=True (fuera de transacción) para no bloquear
+# escrituras mientras se crea el índice.
+
+def ahora_bd():
+    """
+    Hora actual según la BD, en UTC y sin zona (como los datetime.utcnow()
+    de los modelos). Para marcas que no deben depender del reloj de cada
+    servidor de la app.
+    """
+    if db.engine.dialect.name == "postgresql":
+        return db.session.scalar(db.select(func.timezone("UTC", func.now())))
+    # SQLite: texto UTC; CURRENT_TIMESTAMP solo tiene segundos
+    ahora = db.session.scalar(db.select(func.strftime("%Y-%m-%d %H:%M:%f", "now")))
+    return datetime.fromisoformat(ahora)
+
+
+# Configuración de texto para los índices/búsquedas full-text (Postgres)
+FTS_CONFIG = text("'spanish'")
+
+# Los índices de trigramas necesitan la extensión pg_trgm
+event.listen(
+    db.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def trgm_index(tabla, columna):
+    """
+    Índice GIN de trigramas sobre una columna: acelera ILIKE '%q%' y
+    similarity(). Solo se crea en Postgres.
+    """
+    return db.Index(
+        f"ix_{tabla}_{columna}_trgm",
+        columna,
+        postgresql_using="gin",
+        postgresql_ops={columna: "gin_trgm_ops"},
+    ).ddl_if(dialect="postgresql")
+
 
 class Cliente(db.Model):
     __tablename__ = "clientes"
+    __table_args__ = (
+        # Búsqueda/autocomplete de clientes (/clientes/buscar)
+        trgm_index("clientes", "nombre"),
+        trgm_index("clientes", "telefono"),
+        trgm_index("clientes", "nit"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), nullable=False)
@@ -88,6 +140,11 @@ class Talla(db.Model):
 
 class Producto(db.Model):
     __tablename__ = "productos"
+    __table_args__ = (
+        # Búsqueda de productos (/productos/buscar)
+        trgm_index("productos", "sku"),
+        trgm_index("productos", "descripcion"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -97,6 +154,7 @@ class Producto(db.Model):
     tienda_id = db.Column(
         db.Integer,
         db.ForeignKey("tiendas.id"),
+        index=True,
         nullable=False
     )
     tienda = db.relationship("Tienda", back_populates="productos")
@@ -105,6 +163,7 @@ class Producto(db.Model):
     marca_id = db.Column(
         db.Integer,
         db.ForeignKey("marcas_productos.id"),
+        index=True,
         nullable=True
     )
     marca = db.relationship("MarcaProducto", back_populates="productos")
@@ -115,6 +174,7 @@ class Producto(db.Model):
     categoria_id = db.Column(
         db.Integer,
         db.ForeignKey("categorias_productos.id"),
+        index=True,
         nullable=True
     )
     categoria = db.relationship("CategoriaProducto", back_populates="productos")
@@ -123,6 +183,7 @@ class Producto(db.Model):
     talla_id = db.Column(
         db.Integer,
         db.ForeignKey("tallas.id"),
+        index=True,
         nullable=True
     )
     talla = db.relationship("Talla", back_populates="productos")
@@ -130,27 +191,46 @@ class Producto(db.Model):
     costo = db.Column(Numeric(10, 2), nullable=False)
     precio = db.Column(Numeric(10, 2), nullable=False)
     cantidad = db.Column(db.Integer, nullable=False, default=0)
-    imagen = db.Column(db.Text)
+
+    # Imagen (data URL en base64). Diferida: solo se lee de la BD al acceder
+    # a p.imagen, así los listados nunca traen los bytes.
+    imagen = deferred(db.Column(db.Text))
+    # sha256 del contenido de imagen; se usa como ETag y para versionar la URL.
+    # Backfill de filas existentes: `flask backfill-imagen-hash`
+    imagen_hash = db.Column(db.String(64), nullable=True)
 
     orden_items = db.relationship("OrdenItem", back_populates="producto")
 
+    @validates("imagen")
+    def _actualizar_imagen_hash(self, key, value):
+        self.imagen_hash = hashlib.sha256(value.encode("utf-8")).hexdigest() if value else None
+        return value
+
     def __repr__(self):
         return f"<Producto {self.id} - {self.descripcion}>"
 
 
+# Full-text sobre la descripción; la búsqueda usa la misma expresión
+# para que Postgres aproveche el índice.
+PRODUCTO_TSVECTOR = func.to_tsvector(FTS_CONFIG, Producto.descripcion)
+db.Index(
+    "ix_productos_descripcion_fts", PRODUCTO_TSVECTOR, postgresql_using="gin"
+).ddl_if(dialect="postgresql")
+
+
 class Orden(db.Model):
     __tablename__ = "ordenes"
 
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(20), unique=True, nullable=False)
-    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     descuento = db.Column(Numeric(10, 2), nullable=False, default=0)
     total = db.Column(Numeric(10, 2), nullable=False, default=0)
     tipo_pago = db.Column(db.String(50), nullable=True)
     referencia_pago = db.Column(db.String(255), nullable=True)
 
     # Relación con cliente (muchas órdenes -> un cliente)
-    cliente_id = db.Column(db.Integer, db.ForeignKey("clientes.id"), nullable=False)
+    cliente_id = db.Column(db.Integer, db.ForeignKey("clientes.id"), nullable=False, index=True)
     cliente = db.relationship("Cliente", back_populates="ordenes")
 
     # Items de esta orden (solo productos)
@@ -173,11 +253,11 @@ class OrdenItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
     # Relación con la orden
-    orden_id = db.Column(db.Integer, db.ForeignKey("ordenes.id"), nullable=False)
+    orden_id = db.Column(db.Integer, db.ForeignKey("ordenes.id"), nullable=False, index=True)
     orden = db.relationship("Orden", back_populates="items")
 
     # FK a producto
-    producto_id = db.Column(db.Integer, db.ForeignKey("productos.id"), nullable=False)
+    producto_id = db.Column(db.Integer, db.ForeignKey("productos.id"), nullable=False, index=True)
     producto = db.relationship("Producto", back_populates="orden_items")
 
     # Campos adicionales del item
@@ -212,6 +292,12 @@ class Usuario(db.Model):
 
 class Client(db.Model):
     __tablename__ = "clients"
+    __table_args__ = (
+        # Búsqueda/autocomplete de clients (/clients/search)
+        trgm_index("clients", "nombre"),
+        trgm_index("clients", "telefono"),
+        trgm_index("clients", "email"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), nullable=False)
@@ -235,7 +321,7 @@ class Client(db.Model):
             "telefono": self.telefono,
             "email": self.email,
             "activo": self.activo,
-            "saldo": float(self.saldo) if self.saldo is not None else 0,
+            "saldo": self.saldo if self.saldo is not None else 0,
         }
 
 
@@ -287,7 +373,7 @@ class MembershipPlan(db.Model):
             "max_clases_por_semana": self.max_clases_por_semana,
             "max_clases_totales": self.max_clases_totales,
             "duracion_dias": self.duracion_dias,
-            "precio": float(self.precio) if self.precio is not None else None,
+            "precio": self.precio,
             "activo": self.activo,
         }
 
@@ -296,8 +382,8 @@ class Membership(db.Model):
     __tablename__ = "memberships"
 
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
-    plan_id = db.Column(db.Integer, db.ForeignKey("membership_plans.id"), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False, index=True)
+    plan_id = db.Column(db.Integer, db.ForeignKey("membership_plans.id"), nullable=False, index=True)
     fecha_inicio = db.Column(db.Date, nullable=False)
     fecha_fin = db.Column(db.Date, nullable=False)
     estado = db.Column(db.String(50), nullable=False)
@@ -311,17 +397,20 @@ class Membership(db.Model):
     def __repr__(self):
         return f"<Membership client={self.client_id} plan={self.plan_id}>"
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_payments=True):
+        data = {
             "id": self.id,
             "client_id": self.client_id,
             "plan_id": self.plan_id,
-            "fecha_inicio": self.fecha_inicio.isoformat() if self.fecha_inicio else None,
-            "fecha_fin": self.fecha_fin.isoformat() if self.fecha_fin else None,
+            "fecha_inicio": self.fecha_inicio,
+            "fecha_fin": self.fecha_fin,
             "estado": self.estado,
             "clases_usadas": self.clases_usadas,
-            "payments": [p.to_dict() for p in self.payments] if hasattr(self, "payments") and self.payments else [],
         }
+        if include_payments:
+            # En listados, precargar con selectinload(Membership.payments)
+            data["payments"] = [p.to_dict() for p in self.payments]
+        return data
 
 
 class ClassTemplate(db.Model):
@@ -329,7 +418,7 @@ class ClassTemplate(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(255), nullable=False)
-    coach_id = db.Column(db.Integer, db.ForeignKey("coaches.id"), nullable=False)
+    coach_id = db.Column(db.Integer, db.ForeignKey("coaches.id"), nullable=False, index=True)
     dia_semana = db.Column(db.Integer, nullable=False)  # 0-6
     hora_inicio = db.Column(db.Time, nullable=False)
     hora_fin = db.Column(db.Time, nullable=False)
@@ -350,28 +439,43 @@ class ClassTemplate(db.Model):
             "nombre": self.nombre,
             "coach_id": self.coach_id,
             "dia_semana": self.dia_semana,
-            "hora_inicio": self.hora_inicio.isoformat() if self.hora_inicio else None,
-            "hora_fin": self.hora_fin.isoformat() if self.hora_fin else None,
+            "hora_inicio": self.hora_inicio,
+            "hora_fin": self.hora_fin,
             "capacidad": self.capacidad,
             "estado": self.estado,
-            "fecha_inicio": self.fecha_inicio.isoformat() if self.fecha_inicio else None,
-            "fecha_fin": self.fecha_fin.isoformat() if self.fecha_fin else None,
+            "fecha_inicio": self.fecha_inicio,
+            "fecha_fin": self.fecha_fin,
         }
 
 
 class ClassSession(db.Model):
     __tablename__ = "class_sessions"
+    __table_args__ = (
+        # Calendario y límite semanal filtran por rango de fecha
+        db.Index("ix_class_sessions_fecha_hora", "fecha", "hora_inicio"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    template_id = db.Column(db.Integer, db.ForeignKey("class_templates.id"), nullable=True)
+    template_id = db.Column(db.Integer, db.ForeignKey("class_templates.id"), nullable=True, index=True)
     nombre = db.Column(db.String(255), nullable=True)
-    fecha = db.Column(db.Date, nullable=False)
+    # active_history: rollups.py necesita el valor anterior al cambiarlo
+    fecha = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
     hora_inicio = db.Column(db.Time, nullable=False)
     hora_fin = db.Column(db.Time, nullable=False)
-    coach_id = db.Column(db.Integer, db.ForeignKey("coaches.id"), nullable=False)
+    coach_id = db.Column(db.Integer, db.ForeignKey("coaches.id"), nullable=False, index=True)
     capacidad = db.Column(db.Integer, nullable=False)
     estado = db.Column(db.String(50), nullable=False, default="Programada")
     nota = db.Column(db.Text, nullable=True)
+    # Reservas que ocupan cupo; lo mantienen create/update/delete_booking
+    reservadas = db.Column(db.Integer, nullable=False, default=0, server_default=text("0"))
+    actualizado_en = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=func.now(),
+        nullable=False,
+        index=True,
+    )
 
     template = db.relationship("ClassTemplate", back_populates="class_sessions")
     coach = db.relationship("Coach", back_populates="class_sessions")
@@ -385,34 +489,50 @@ class ClassSession(db.Model):
             "id": self.id,
             "template_id": self.template_id,
             "nombre": self.nombre,
-            "fecha": self.fecha.isoformat() if self.fecha else None,
-            "hora_inicio": self.hora_inicio.isoformat() if self.hora_inicio else None,
-            "hora_fin": self.hora_fin.isoformat() if self.hora_fin else None,
+            "fecha": self.fecha,
+            "hora_inicio": self.hora_inicio,
+            "hora_fin": self.hora_fin,
             "coach_id": self.coach_id,
             "capacidad": self.capacidad,
             "estado": self.estado,
             "nota": self.nota,
+            "reservadas": self.reservadas,
         }
 
 
 class Booking(db.Model):
     __tablename__ = "bookings"
     __table_args__ = (
+        # También sirve como índice por session_id (columna inicial)
         db.UniqueConstraint("session_id", "client_id", name="uq_booking_session_client"),
+        # Validación de límites de la membresía en create_booking
+        db.Index("ix_bookings_membership_estado", "membership_id", "estado"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey("class_sessions.id"), nullable=False)
-    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
+    # active_history: rollups.py necesita el valor anterior al cambiarlo
+    session_id = db.column_property(db.Column(db.Integer, db.ForeignKey("class_sessions.id"), nullable=False), active_history=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False, index=True)
     membership_id = db.Column(db.Integer, db.ForeignKey("memberships.id"), nullable=True)
     estado = db.Column(db.String(50), nullable=False)
     asistio = db.Column(db.Boolean, default=False, nullable=False)
     check_in_at = db.Column(db.DateTime, nullable=True)
+    actualizado_en = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=func.now(),
+        nullable=False,
+        index=True,
+    )
 
     session = db.relationship("ClassSession", back_populates="bookings")
     client = db.relationship("Client", back_populates="bookings")
     membership = db.relationship("Membership", back_populates="bookings")
 
+    # Estados que no ocupan cupo en la clase
+    ESTADOS_SIN_CUPO = ("Cancelada",)
+
     def __repr__(self):
         return f"<Booking session={self.session_id} client={self.client_id}>"
 
@@ -424,20 +544,23 @@ class Booking(db.Model):
             "membership_id": self.membership_id,
             "estado": self.estado,
             "asistio": self.asistio,
-            "check_in_at": self.check_in_at.isoformat() if self.check_in_at else None,
+            "check_in_at": self.check_in_at,
         }
 
 
 class AccountMovement(db.Model):
     __tablename__ = "account_movements"
+    __table_args__ = (
+        db.Index("ix_account_movements_client_creado", "client_id", "creado_en"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
     amount = db.Column(Numeric(10, 2), nullable=False)  # >0 deuda, <0 abono
     tipo = db.Column(db.String(20), nullable=False)  # fine | payment | adjustment
-    booking_id = db.Column(db.Integer, db.ForeignKey("bookings.id"), nullable=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey("bookings.id"), nullable=True, index=True)
     nota = db.Column(db.String(255), nullable=True)
-    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     client = db.relationship("Client", back_populates="account_movements")
     payments = db.relationship("Payment", back_populates="movement", cascade="all, delete-orphan")
@@ -445,16 +568,48 @@ class AccountMovement(db.Model):
     def __repr__(self):
         return f"<AccountMovement client={self.client_id} amount={self.amount}>"
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_payments=True):
+        data = {
             "id": self.id,
             "client_id": self.client_id,
-            "amount": float(self.amount),
+            "amount": self.amount,
             "tipo": self.tipo,
             "booking_id": self.booking_id,
             "nota": self.nota,
-            "creado_en": self.creado_en.isoformat() if self.creado_en else None,
-            "payments": [p.to_dict() for p in self.payments] if self.payments else [],
+            "creado_en": self.creado_en,
+        }
+        if include_payments:
+            # En listados, precargar con selectinload(AccountMovement.payments)
+            data["payments"] = [p.to_dict() for p in self.payments]
+        return data
+
+
+class BalanceCheckpoint(db.Model):
+    """
+    Saldo acumulado de un cliente hasta un movimiento (inclusive).
+    El ledger parte del último checkpoint en vez de sumar todo el historial.
+    """
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (
+        db.UniqueConstraint("client_id", "movement_id", name="uq_checkpoint_client_movement"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
+    movement_id = db.Column(db.Integer, db.ForeignKey("account_movements.id"), nullable=False)
+    saldo = db.Column(Numeric(10, 2), nullable=False)
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<BalanceCheckpoint client={self.client_id} movement={self.movement_id} saldo={self.saldo}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "client_id": self.client_id,
+            "movement_id": self.movement_id,
+            "saldo": self.saldo,
+            "creado_en": self.creado_en,
         }
 
 
@@ -462,14 +617,23 @@ class Payment(db.Model):
     __tablename__ = "payments"
 
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=True)
-    movement_id = db.Column(db.Integer, db.ForeignKey("account_movements.id"), nullable=True)
-    membership_id = db.Column(db.Integer, db.ForeignKey("memberships.id"), nullable=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=True, index=True)
+    movement_id = db.Column(db.Integer, db.ForeignKey("account_movements.id"), nullable=True, index=True)
+    membership_id = db.Column(db.Integer, db.ForeignKey("memberships.id"), nullable=True, index=True)
     payment_type = db.Column(db.String(20), nullable=True)  # membership | multa | otro
     amount = db.Column(Numeric(10, 2), nullable=True)
     payment_method = db.Column(db.String(50), nullable=True)
     payment_reference = db.Column(db.String(255), nullable=True)
-    fecha_pago = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # active_history: rollups.py necesita el valor anterior al cambiarlo
+    fecha_pago = db.column_property(db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True), active_history=True)
+    actualizado_en = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=func.now(),
+        nullable=False,
+        index=True,
+    )
 
     client = db.relationship("Client", back_populates="payments")
     movement = db.relationship("AccountMovement", back_populates="payments")
@@ -482,8 +646,72 @@ class Payment(db.Model):
             "movement_id": self.movement_id,
             "membership_id": self.membership_id,
             "payment_type": self.payment_type,
-            "amount": float(self.amount) if self.amount is not None else None,
+            "amount": self.amount,
             "payment_method": self.payment_method,
             "payment_reference": self.payment_reference,
-            "fecha_pago": self.fecha_pago.isoformat() if self.fecha_pago else None,
+            "fecha_pago": self.fecha_pago,
         }
+
+
+class DailyPaymentRollup(db.Model):
+    """Totales diarios de pagos por tipo y método (ver rollups.py)."""
+    __tablename__ = "daily_payment_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("dia", "payment_type", "payment_method", name="uq_payment_rollup"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    # "" en lugar de NULL para que la restricción única aplique
+    payment_type = db.Column(db.String(20), nullable=False, default="")
+    payment_method = db.Column(db.String(50), nullable=False, default="")
+    pagos = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(Numeric(12, 2), nullable=False, default=0)
+
+
+class DailyClassRollup(db.Model):
+    """Clases, reservas y asistencias por día y coach (ver rollups.py)."""
+    __tablename__ = "daily_class_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("dia", "coach_id", name="uq_class_rollup"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    coach_id = db.Column(db.Integer, db.ForeignKey("coaches.id"), nullable=False)
+    clases = db.Column(db.Integer, nullable=False, default=0)
+    reservas = db.Column(db.Integer, nullable=False, default=0)
+    asistencias = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RollupDiaPendiente(db.Model):
+    """
+    Día que dejó de tener datos sin que quede una fila con actualizado_en
+    (pago/sesión borrados o movidos a otra fecha). El próximo refresco lo
+    recalcula y borra el registro (ver rollups.py). Puede repetirse.
+    """
+    __tablename__ = "rollup_dias_pendientes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)  # pagos | clases
+    dia = db.Column(db.Date, nullable=False)
+
+
+class RollupState(db.Model):
+    """Hasta cuándo están al día los rollups (un registro por nombre)."""
+    __tablename__ = "rollup_state"
+
+    nombre = db.Column(db.String(50), primary_key=True)
+    actualizado_hasta = db.Column(db.DateTime, nullable=False)
+
+
+class TableVersion(db.Model):
+    """
+    Contador de versión por tabla, incrementado en la misma transacción que
+    la escribe (ver versioning.py). Sirve para ETag/Last-Modified.
+    """
+    __tablename__ = "table_versions"
+
+    tabla = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
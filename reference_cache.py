@@ -0,0 +1,129 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+
+
+class ReferenceCache:
+    """
+    Cache en memoria (por proceso) de una tabla de referencia pequeña,
+    indexada por id y por nombre.
+
+    Se invalida al terminar cualquier transacción que haya escrito en la
+    tabla (ver los listeners de sesión al final del módulo). Como cada worker tiene su propio cache, además
+    expira cada `ttl` segundos para recoger cambios hechos por otros workers,
+    y las vistas con @versioned lo recargan apenas cambia la versión de la
+    tabla (sync_versions), para no servir nombres viejos bajo un ETag nuevo.
+    """
+
+    def __init__(self, model, ttl=300):
+        self.model = model
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_nombre = None
+        self._loaded_at = 0.0
+        self._version = None
+
+    def _load(self):
+        rows = db.session.query(self.model.id, self.model.nombre).all()
+        by_id = {row.id: row.nombre for row in rows}
+        by_nombre = {row.nombre: row.id for row in rows}
+        with self._lock:
+            self._by_id = by_id
+            self._by_nombre = by_nombre
+            self._loaded_at = time.monotonic()
+        return by_id, by_nombre
+
+    def _snapshot(self):
+        with self._lock:
+            by_id, by_nombre, loaded_at = self._by_id, self._by_nombre, self._loaded_at
+        if by_id is None or time.monotonic() - loaded_at > self.ttl:
+            return self._load()
+        return by_id, by_nombre
+
+    def get_nombre(self, ref_id):
+        """Nombre para ref_id, o None si no existe."""
+        if ref_id is None:
+            return None
+        by_id, _ = self._snapshot()
+        if ref_id not in by_id:
+            # Puede ser un registro creado por otro worker
+            by_id, _ = self._load()
+        return by_id.get(ref_id)
+
+    def get_id(self, nombre):
+        """Id para nombre, o None si no existe."""
+        if not nombre:
+            return None
+        _, by_nombre = self._snapshot()
+        if nombre not in by_nombre:
+            _, by_nombre = self._load()
+        return by_nombre.get(nombre)
+
+    def exists(self, ref_id):
+        return self.get_nombre(ref_id) is not None
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = None
+            self._by_nombre = None
+
+    def sync_version(self, version):
+        """Invalida si la tabla cambió de versión (p. ej. escrita por otro worker)."""
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._by_id = None
+                self._by_nombre = None
+
+
+_caches = {}
+
+
+def init_reference_caches(app, models):
+    """
+    Crea un ReferenceCache por modelo y los deja en app.extensions.
+    Devuelve el dict {modelo: cache}.
+    """
+    ttl = app.config.get("REFERENCE_CACHE_TTL", 300)
+    for model in models:
+        _caches[model] = ReferenceCache(model, ttl=ttl)
+    app.extensions["reference_caches"] = _caches
+    return _caches
+
+
+def sync_versions(versiones):
+    """
+    Recibe [(tabla, version, actualizado_en)] (versioning.table_versions) e
+    invalida los caches de las tablas cuya versión cambió. La versión se lee
+    después del commit que la incrementó, así que la recarga ve esas filas.
+    """
+    por_tabla = {model.__tablename__: cache for model, cache in _caches.items()}
+    for tabla, version, _ in versiones:
+        cache = por_tabla.get(tabla)
+        if cache is not None:
+            cache.sync_version(version)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_reference_changes(session, flush_context):
+    if not _caches:
+        return
+    touched = session.info.setdefault("reference_models_touched", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if type(obj) in _caches:
+            touched.add(type(obj))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _invalidate_on_transaction_end(session, transaction):
+    # Commit o rollback: en ambos casos el cache pudo haber visto filas
+    # tocadas en esta transacción, así que se recarga en el próximo uso.
+    if transaction.parent is not None:
+        return
+    for model in session.info.pop("reference_models_touched", ()):
+        _caches[model].invalidate()
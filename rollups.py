@@ -0,0 +1,200 @@
+from datetime import date, timedelta
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from models import (
+    db,
+    Booking,
+    ClassSession,
+    DailyClassRollup,
+    DailyPaymentRollup,
+    Payment,
+    RollupDiaPendiente,
+    RollupState,
+    ahora_bd,
+)
+
+ROLLUP_NOMBRE = "dashboard"
+
+# Cada refresco incremental vuelve a procesar este margen antes de la marca
+# anterior. Tiene que cubrir la transacción de escritura más larga (una fila
+# estampada antes de la marca puede confirmarse después de leerla) y el
+# desfase de reloj entre los servidores de la app, que estampan
+# actualizado_en, y la BD, que da la marca. Recalcular un día es idempotente.
+SOLAPE = timedelta(minutes=10)
+
+
+def _como_fecha(dia):
+    # func.date() devuelve texto en SQLite y date en Postgres
+    return date.fromisoformat(dia) if isinstance(dia, str) else dia
+
+
+def _dias_pagos(desde):
+    dia = func.date(Payment.fecha_pago)
+    query = db.session.query(dia).distinct()
+    if desde is not None:
+        query = query.filter(Payment.actualizado_en > desde)
+    return {_como_fecha(d) for (d,) in query}
+
+
+def _dias_clases(desde):
+    query = db.session.query(ClassSession.fecha).distinct()
+    if desde is None:
+        return {d for (d,) in query}
+    sesiones = query.filter(ClassSession.actualizado_en > desde)
+    reservas = (
+        db.session.query(ClassSession.fecha)
+        .join(Booking, Booking.session_id == ClassSession.id)
+        .filter(Booking.actualizado_en > desde)
+    )
+    return {d for (d,) in sesiones.union(reservas)}
+
+
+def _recalcular_pagos(dias):
+    dia = func.date(Payment.fecha_pago)
+    db.session.execute(delete(DailyPaymentRollup).where(DailyPaymentRollup.dia.in_(dias)))
+    db.session.execute(
+        insert(DailyPaymentRollup).from_select(
+            ["dia", "payment_type", "payment_method", "pagos", "total"],
+            select(
+                dia,
+                func.coalesce(Payment.payment_type, ""),
+                func.coalesce(Payment.payment_method, ""),
+                func.count(Payment.id),
+                func.coalesce(func.sum(Payment.amount), 0),
+            )
+            .where(dia.in_(dias))
+            .group_by(
+                dia,
+                func.coalesce(Payment.payment_type, ""),
+                func.coalesce(Payment.payment_method, ""),
+            ),
+        )
+    )
+
+
+def _recalcular_clases(dias):
+    # El filtro por fecha va dentro del agregado: así solo se leen las
+    # reservas de las sesiones del lote y no todo el historial
+    reservas = (
+        select(
+            Booking.session_id,
+            func.count(Booking.id).label("reservas"),
+            func.sum(case((Booking.asistio.is_(True), 1), else_=0)).label("asistencias"),
+        )
+        .join(ClassSession, Booking.session_id == ClassSession.id)
+        .where(
+            ClassSession.fecha.in_(dias),
+            Booking.estado.notin_(Booking.ESTADOS_SIN_CUPO),
+        )
+        .group_by(Booking.session_id)
+        .subquery()
+    )
+    db.session.execute(delete(DailyClassRollup).where(DailyClassRollup.dia.in_(dias)))
+    db.session.execute(
+        insert(DailyClassRollup).from_select(
+            ["dia", "coach_id", "clases", "reservas", "asistencias"],
+            select(
+                ClassSession.fecha,
+                ClassSession.coach_id,
+                func.count(ClassSession.id),
+                func.coalesce(func.sum(reservas.c.reservas), 0),
+                func.coalesce(func.sum(reservas.c.asistencias), 0),
+            )
+            .select_from(ClassSession)
+            .outerjoin(reservas, reservas.c.session_id == ClassSession.id)
+            .where(ClassSession.fecha.in_(dias))
+            .group_by(ClassSession.fecha, ClassSession.coach_id),
+        )
+    )
+
+
+def refrescar_rollups(completo=False, lote=100, solape=SOLAPE):
+    """
+    Recalcula los rollups diarios solo para los días con pagos, sesiones o
+    reservas modificados (actualizado_en) desde el último refresco, más los
+    días pendientes por bajas o cambios de fecha (RollupDiaPendiente); con
+    completo=True recalcula todo el historial.
+
+    Cada día se borra y se vuelve a agregar con INSERT ... SELECT ... GROUP BY,
+    de a `lote` días por sentencia. Todo va en una transacción.
+    La marca (actualizado_hasta) es la hora de la BD y cada refresco relee
+    desde `solape` antes de ella (ver SOLAPE).
+    Los DELETE masivos (query.delete()) no dejan días pendientes: después
+    de uno hace falta un refresco completo.
+    Devuelve (dias_pagos, dias_clases) recalculados.
+    """
+    ahora = ahora_bd()
+    estado = db.session.get(RollupState, ROLLUP_NOMBRE)
+    desde = None if completo or estado is None else estado.actualizado_hasta - solape
+
+    if desde is None:
+        # Refresco completo: también limpia días que ya no tienen datos
+        db.session.execute(delete(DailyPaymentRollup))
+        db.session.execute(delete(DailyClassRollup))
+
+    dias_pagos = _dias_pagos(desde)
+    dias_clases = _dias_clases(desde)
+
+    # Solo se borran los pendientes leídos aquí (por id, no por rango: uno
+    # con id menor puede confirmarse después); el resto queda para el
+    # próximo refresco
+    pendientes = db.session.query(
+        RollupDiaPendiente.id, RollupDiaPendiente.tipo, RollupDiaPendiente.dia
+    ).all()
+    if desde is not None:
+        dias_pagos |= {dia for _, tipo, dia in pendientes if tipo == "pagos"}
+        dias_clases |= {dia for _, tipo, dia in pendientes if tipo == "clases"}
+    if pendientes:
+        db.session.execute(
+            delete(RollupDiaPendiente).where(
+                RollupDiaPendiente.id.in_([id_ for id_, _, _ in pendientes])
+            )
+        )
+
+    dias_pagos, dias_clases = sorted(dias_pagos), sorted(dias_clases)
+    for i in range(0, len(dias_pagos), lote):
+        _recalcular_pagos(dias_pagos[i:i + lote])
+    for i in range(0, len(dias_clases), lote):
+        _recalcular_clases(dias_clases[i:i + lote])
+
+    # Lo que se confirme después de leer (aunque esté estampado antes de
+    # `ahora`) lo recoge el próximo refresco gracias al solape
+    if estado is None:
+        db.session.add(RollupState(nombre=ROLLUP_NOMBRE, actualizado_hasta=ahora))
+    else:
+        estado.actualizado_hasta = ahora
+    db.session.commit()
+    return len(dias_pagos), len(dias_clases)
+
+
+def _dias_anteriores(obj, campo):
+    """Valores previos de campo si cambió en este flush."""
+    return [v for v in inspect(obj).attrs[campo].history.deleted if v is not None]
+
+
+@event.listens_for(Session, "before_flush")
+def _registrar_dias_pendientes(session, flush_context, instances):
+    # El día nuevo lo encuentra actualizado_en; el que queda sin la fila
+    # (baja o cambio de fecha) se anota aquí
+    pendientes = []
+    for obj in session.dirty:
+        if isinstance(obj, Payment):
+            pendientes += [("pagos", d.date()) for d in _dias_anteriores(obj, "fecha_pago")]
+        elif isinstance(obj, ClassSession):
+            pendientes += [("clases", d) for d in _dias_anteriores(obj, "fecha")]
+        elif isinstance(obj, Booking):
+            for session_id in _dias_anteriores(obj, "session_id"):
+                sesion = session.get(ClassSession, session_id)
+                if sesion is not None:
+                    pendientes.append(("clases", sesion.fecha))
+    for obj in session.deleted:
+        if isinstance(obj, Payment) and obj.fecha_pago is not None:
+            pendientes.append(("pagos", obj.fecha_pago.date()))
+        elif isinstance(obj, ClassSession):
+            pendientes.append(("clases", obj.fecha))
+        elif isinstance(obj, Booking) and obj.session is not None:
+            pendientes.append(("clases", obj.session.fecha))
+    for tipo, dia in set(pendientes):
+        session.add(RollupDiaPendiente(tipo=tipo, dia=dia))
@@ -0,0 +1,34 @@
+from sqlalchemy import func, or_
+
+from models import db, FTS_CONFIG
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def buscar(query, q, columnas, limite, orden, tsvector=None):
+    """
+    Búsqueda por texto sobre `columnas` (substring, sin distinguir mayúsculas).
+
+    En Postgres el ILIKE '%q%' usa los índices de trigramas (pg_trgm) y los
+    resultados se ordenan por similarity() (más ts_rank si se pasa un
+    tsvector indexado, que además encuentra palabras con otra flexión).
+    En otros motores cae a LIKE ordenado por `orden`.
+    Devuelve como máximo `limite` filas.
+    """
+    filtros = [col.icontains(q, autoescape=True) for col in columnas]
+
+    if db.engine.dialect.name != "postgresql":
+        return query.filter(or_(*filtros)).order_by(orden).limit(limite).all()
+
+    rank = func.greatest(*[func.similarity(col, q) for col in columnas])
+    if tsvector is not None:
+        tsquery = func.plainto_tsquery(FTS_CONFIG, q)
+        filtros.append(tsvector.op("@@")(tsquery))
+        rank = rank + func.ts_rank(tsvector, tsquery)
+    return (
+        query.filter(or_(*filtros))
+        .order_by(rank.desc(), orden)
+        .limit(limite)
+        .all()
+    )
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def make_app(uri):
+    """create_app() contra otra BD (Config se arma al importar config.py)."""
+    config.Config.SQLALCHEMY_DATABASE_URI = uri
+    config.Config.SQLALCHEMY_ENGINE_OPTIONS = config._engine_options(uri)
+    return create_app()
+
+
+@pytest.fixture
+def app():
+    """App contra SQLite en memoria, con las tablas creadas."""
+    app = make_app("sqlite://")
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def url(app):
+    """URL bajo el prefijo con que se monta la app (URL_PREFIX)."""
+    prefix = app.config.get("URL_PREFIX") or ""
+    return lambda path: prefix + path
+
+
+@pytest.fixture
+def contar_queries(app):
+    """contar_queries(fn) -> (resultado de fn, sentencias SQL ejecutadas)."""
+    with app.app_context():
+        engine = db.engine
+    sentencias = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+
+    def contar(fn):
+        sentencias.clear()
+        result = fn()
+        return result, len(sentencias)
+
+    yield contar
+    event.remove(engine, "before_cursor_execute", listener)
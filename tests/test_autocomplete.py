@@ -0,0 +1,36 @@
+"""
+/clients/autocomplete y /clientes/autocomplete devuelven las mismas claves
+con y sin AUTOCOMPLETE_INDEX (user-022).
+"""
+import pytest
+
+import config
+from models import db, Client, Cliente
+
+
+@pytest.fixture(autouse=True, params=[True, False], ids=["indice", "bd"])
+def autocomplete_index(request, monkeypatch):
+    # autouse: se aplica antes de que el fixture app llame a create_app()
+    monkeypatch.setattr(config.Config, "AUTOCOMPLETE_INDEX", request.param)
+
+
+@pytest.fixture
+def clientes(app):
+    with app.app_context():
+        db.session.add_all([
+            Client(nombre="Ana Lopez", email="ana@example.com", telefono="5551234", saldo=10),
+            Cliente(nombre="Ana Perez", nit="1234567", telefono="5559876", email="ap@example.com"),
+        ])
+        db.session.commit()
+
+
+@pytest.mark.parametrize("path, claves", [
+    ("/clients/autocomplete", {"id", "nombre", "email", "telefono"}),
+    ("/clientes/autocomplete", {"id", "nombre", "nit", "telefono", "email"}),
+])
+def test_mismas_claves_con_y_sin_indice(client, url, clientes, path, claves):
+    resp = client.get(url(path + "?q=ana"))
+    assert resp.status_code == 200
+    sugerencias = resp.get_json()
+    assert len(sugerencias) == 1
+    assert set(sugerencias[0]) == claves
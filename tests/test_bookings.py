@@ -0,0 +1,52 @@
+"""PUT/PATCH /bookings/<id> con session_id como string del JSON (user-010)."""
+from datetime import date, time
+
+import pytest
+
+from models import db, Booking, ClassSession, Client, Coach
+
+
+@pytest.fixture
+def reserva(app):
+    """(booking_id, sesión actual, otra sesión), con un cupo ocupado."""
+    with app.app_context():
+        coach = Coach(nombre="Coach", telefono="0")
+        db.session.add(coach)
+        db.session.flush()
+        sesiones = [
+            ClassSession(
+                fecha=date(2026, 3, 2),
+                hora_inicio=time(7 + 2 * i),
+                hora_fin=time(8 + 2 * i),
+                coach_id=coach.id,
+                capacidad=5,
+                reservadas=1 - i,
+            )
+            for i in range(2)
+        ]
+        client = Client(nombre="Ana", telefono="1")
+        db.session.add_all(sesiones + [client])
+        db.session.flush()
+        booking = Booking(session_id=sesiones[0].id, client_id=client.id, estado="Reservada")
+        db.session.add(booking)
+        db.session.commit()
+        return booking.id, sesiones[0].id, sesiones[1].id
+
+
+def test_session_id_como_string(app, client, url, reserva):
+    booking_id, anterior, nueva = reserva
+    resp = client.patch(url(f"/bookings/{booking_id}"), json={"session_id": str(nueva)})
+    assert resp.status_code == 200
+    assert resp.get_json()["session_id"] == nueva
+    with app.app_context():
+        assert db.session.get(ClassSession, anterior).reservadas == 0
+        assert db.session.get(ClassSession, nueva).reservadas == 1
+
+
+@pytest.mark.parametrize("session_id", ["abc", None, [1]])
+def test_session_id_invalido(app, client, url, reserva, session_id):
+    booking_id, anterior, _ = reserva
+    resp = client.patch(url(f"/bookings/{booking_id}"), json={"session_id": session_id})
+    assert resp.status_code == 400
+    with app.app_context():
+        assert db.session.get(Booking, booking_id).session_id == anterior
@@ -0,0 +1,97 @@
+"""
+Cupo de una clase bajo reservas concurrentes (user-009).
+
+Necesita Postgres (SELECT ... FOR UPDATE): se salta salvo que DATABASE_URL
+apunte a una BD postgresql://. Usar una base de pruebas: crea las tablas
+que falten y borra al final solo las filas que inserta.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time
+
+import pytest
+
+from conftest import make_app
+from models import db, Booking, ClassSession, Client, Coach
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+pytestmark = pytest.mark.skipif(
+    not DATABASE_URL.startswith("postgresql"),
+    reason="requiere DATABASE_URL de Postgres",
+)
+
+CAPACIDAD = 10
+RESERVAS = 200
+# Por debajo de pool_size + max_overflow (10 + 20 por defecto)
+HILOS = 25
+
+
+@pytest.fixture
+def pg_app():
+    app = make_app(DATABASE_URL)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def sesion_llena(pg_app):
+    """Una clase con CAPACIDAD cupos y RESERVAS clientes distintos."""
+    with pg_app.app_context():
+        coach = Coach(nombre="Coach concurrencia", telefono="0")
+        db.session.add(coach)
+        db.session.flush()
+        sesion = ClassSession(
+            fecha=date.today(),
+            hora_inicio=time(7),
+            hora_fin=time(8),
+            coach_id=coach.id,
+            capacidad=CAPACIDAD,
+        )
+        clientes = [Client(nombre=f"Concurrencia {i}", telefono=str(i)) for i in range(RESERVAS)]
+        db.session.add(sesion)
+        db.session.add_all(clientes)
+        db.session.commit()
+        ids = (coach.id, sesion.id, [c.id for c in clientes])
+
+    yield ids
+
+    coach_id, session_id, client_ids = ids
+    with pg_app.app_context():
+        Booking.query.filter(Booking.session_id == session_id).delete()
+        ClassSession.query.filter(ClassSession.id == session_id).delete()
+        Client.query.filter(Client.id.in_(client_ids)).delete()
+        Coach.query.filter(Coach.id == coach_id).delete()
+        db.session.commit()
+
+
+def test_reservas_concurrentes_respetan_capacidad(pg_app, sesion_llena):
+    _, session_id, client_ids = sesion_llena
+    path = (pg_app.config.get("URL_PREFIX") or "") + "/bookings"
+
+    def reservar(client_id):
+        with pg_app.test_client() as client:
+            resp = client.post(path, json={
+                "session_id": session_id,
+                "client_id": client_id,
+                "estado": "Reservada",
+            })
+            return resp.status_code
+
+    with ThreadPoolExecutor(max_workers=HILOS) as pool:
+        codigos = list(pool.map(reservar, client_ids))
+
+    assert codigos.count(201) == CAPACIDAD
+    assert codigos.count(400) == RESERVAS - CAPACIDAD
+
+    with pg_app.app_context():
+        sesion = db.session.get(ClassSession, session_id)
+        ocupadas = Booking.query.filter(
+            Booking.session_id == session_id,
+            Booking.estado.notin_(Booking.ESTADOS_SIN_CUPO),
+        ).count()
+        assert ocupadas == sesion.reservadas
+        assert sesion.reservadas <= sesion.capacidad
@@ -0,0 +1,36 @@
+"""
+Un movimiento con id menor que se confirma después de crear el checkpoint
+sigue entrando en el saldo del ledger (user-014).
+"""
+from datetime import datetime, timedelta
+
+from models import db, AccountMovement, BalanceCheckpoint, Client
+
+
+def test_movimiento_con_id_menor_confirmado_despues(app, client, url):
+    runner = app.test_cli_runner()
+    viejo = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        c = Client(nombre="Ana", telefono="1")
+        db.session.add(c)
+        db.session.flush()
+        client_id = c.id
+        for i in (1, 2, 3):
+            db.session.add(AccountMovement(id=i, client_id=client_id, amount=10, tipo="fine", creado_en=viejo))
+        # id 5 ya confirmado; el 4 (insertado antes) sigue en una transacción abierta
+        db.session.add(AccountMovement(id=5, client_id=client_id, amount=100, tipo="fine"))
+        db.session.commit()
+
+    result = runner.invoke(args=["crear-checkpoints", "--min-movimientos", "1"])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        checkpoint = BalanceCheckpoint.query.one()
+        assert (checkpoint.movement_id, float(checkpoint.saldo)) == (3, 30.0)
+        # Se confirma la transacción del movimiento 4
+        db.session.add(AccountMovement(id=4, client_id=client_id, amount=1000, tipo="fine"))
+        db.session.commit()
+
+    ledger = client.get(url(f"/clients/{client_id}/ledger")).get_json()
+    assert [m["id"] for m in ledger["movimientos"]] == [4, 5]
+    assert ledger["saldo_final"] == 1130.0
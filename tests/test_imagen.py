@@ -0,0 +1,73 @@
+"""
+GET /productos/<id>/imagen responde 304 sin cargar la columna imagen y no
+escribe en la BD para filas sin imagen_hash (user-003).
+"""
+import base64
+import hashlib
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Producto, Tienda
+
+PNG = base64.b64encode(b"\x89PNG imagen de prueba").decode()
+
+
+@pytest.fixture
+def sentencias(app):
+    """Lista con las sentencias SQL que se ejecuten durante el test."""
+    with app.app_context():
+        engine = db.engine
+    capturadas = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        capturadas.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    yield capturadas
+    event.remove(engine, "before_cursor_execute", listener)
+
+
+def crear_producto(app, imagen_hash):
+    with app.app_context():
+        p = Producto(
+            descripcion="Malla",
+            costo=1,
+            precio=2,
+            tienda=Tienda(nombre="Centro"),
+            imagen="data:image/png;base64," + PNG,
+            imagen_hash=imagen_hash,
+        )
+        db.session.add(p)
+        db.session.commit()
+        return p.id
+
+
+def test_304_sin_leer_la_imagen(app, client, url, sentencias):
+    producto_id = crear_producto(app, "abc123")
+    primera = client.get(url(f"/productos/{producto_id}/imagen"))
+    assert primera.status_code == 200
+    assert primera.mimetype == "image/png"
+
+    sentencias.clear()
+    segunda = client.get(
+        url(f"/productos/{producto_id}/imagen"),
+        headers={"If-None-Match": primera.headers["ETag"]},
+    )
+    assert segunda.status_code == 304
+    assert segunda.headers["ETag"] == primera.headers["ETag"]
+    assert len(sentencias) == 1
+    assert "productos.imagen AS" not in sentencias[0]
+
+
+def test_sin_hash_no_escribe(app, client, url, sentencias):
+    producto_id = crear_producto(app, None)
+    sentencias.clear()
+    resp = client.get(url(f"/productos/{producto_id}/imagen"))
+    assert resp.status_code == 200
+    imagen_hash = hashlib.sha256(("data:image/png;base64," + PNG).encode("utf-8")).hexdigest()
+    assert resp.headers["ETag"] == f'"{imagen_hash}"'
+    assert not [s for s in sentencias if s.lstrip().upper().startswith("UPDATE")]
+
+    with app.app_context():
+        assert db.session.get(Producto, producto_id).imagen_hash is None
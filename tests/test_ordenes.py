@@ -0,0 +1,84 @@
+"""GET /ordenes y /ordenes/<id> hacen un número fijo de queries (user-001)."""
+from models import (
+    db,
+    CategoriaProducto,
+    Cliente,
+    MarcaProducto,
+    Orden,
+    OrdenItem,
+    Producto,
+    Talla,
+    Tienda,
+)
+
+
+def crear_ordenes(app, n, items_por_orden=3, inicio=0):
+    """n órdenes de clientes distintos, cada una con productos distintos."""
+    with app.app_context():
+        ids = []
+        for i in range(inicio, inicio + n):
+            orden = Orden(codigo=f"O-{i}", cliente=Cliente(nombre=f"Cliente {i}", telefono=str(i)))
+            for j in range(items_por_orden):
+                producto = Producto(
+                    descripcion=f"Producto {i}-{j}",
+                    costo=1,
+                    precio=2,
+                    tienda=Tienda(nombre=f"Tienda {i}-{j}"),
+                    marca=MarcaProducto(nombre=f"Marca {i}-{j}"),
+                    categoria=CategoriaProducto(nombre=f"Categoría {i}-{j}"),
+                    talla=Talla(nombre=f"Talla {i}-{j}"),
+                )
+                orden.items.append(OrdenItem(producto=producto, cantidad=1, precio_unitario=2))
+            db.session.add(orden)
+            db.session.flush()
+            ids.append(orden.id)
+        db.session.commit()
+        return ids
+
+
+def queries_de(client, contar_queries, path):
+    # La primera llamada recarga los caches de referencia; se mide la segunda
+    assert client.get(path).status_code == 200
+    resp, total = contar_queries(lambda: client.get(path))
+    assert resp.status_code == 200
+    return resp, total
+
+
+def test_listar_ordenes_queries_constantes(app, client, url, contar_queries):
+    crear_ordenes(app, 1)
+    resp, con_una = queries_de(client, contar_queries, url("/ordenes"))
+    assert len(resp.get_json()) == 1
+
+    crear_ordenes(app, 20, inicio=1)
+    resp, con_muchas = queries_de(client, contar_queries, url("/ordenes"))
+    assert len(resp.get_json()) == 21
+
+    assert con_una == con_muchas
+
+
+def test_listar_ordenes_paginado_queries_constantes(app, client, url, contar_queries):
+    crear_ordenes(app, 1)
+    _, con_una = queries_de(client, contar_queries, url("/ordenes?limit=50"))
+    crear_ordenes(app, 20, inicio=1)
+    _, con_muchas = queries_de(client, contar_queries, url("/ordenes?limit=50"))
+    assert con_una == con_muchas
+
+
+def test_obtener_orden_queries_constantes(app, client, url, contar_queries):
+    (chica,) = crear_ordenes(app, 1, items_por_orden=1)
+    (grande,) = crear_ordenes(app, 1, items_por_orden=25, inicio=1)
+
+    resp, con_un_item = queries_de(client, contar_queries, url(f"/ordenes/{chica}"))
+    assert len(resp.get_json()["items"]) == 1
+    resp, con_muchos_items = queries_de(client, contar_queries, url(f"/ordenes/{grande}"))
+    assert len(resp.get_json()["items"]) == 25
+
+    assert con_un_item == con_muchos_items
+
+
+def test_detalle_igual_al_listado(app, client, url):
+    ids = crear_ordenes(app, 3)
+    listado = {orden["id"]: orden for orden in client.get(url("/ordenes")).get_json()}
+    for orden_id in ids:
+        assert client.get(url(f"/ordenes/{orden_id}")).get_json() == listado[orden_id]
+    assert client.get(url("/ordenes/999999")).status_code == 404
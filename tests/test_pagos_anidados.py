@@ -0,0 +1,67 @@
+"""
+/memberships y /account-movements precargan los pagos anidados con un
+número fijo de queries, con y sin ?payments=0 (user-016).
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from models import db, AccountMovement, Client, Membership, MembershipPlan, Payment
+
+
+def crear_membresias(app, n, pagos_por_membresia=3):
+    with app.app_context():
+        plan = MembershipPlan.query.first() or MembershipPlan(nombre="Mensual", precio=100)
+        for i in range(n):
+            client = Client(nombre=f"Client {i}", telefono=str(i))
+            membership = Membership(
+                client=client,
+                plan=plan,
+                fecha_inicio=date.today(),
+                fecha_fin=date.today() + timedelta(days=30),
+                estado="Activa",
+            )
+            db.session.add(membership)
+            for _ in range(pagos_por_membresia):
+                db.session.add(Payment(client=client, membership=membership, amount=50))
+        db.session.commit()
+
+
+def crear_movimientos(app, n, pagos_por_movimiento=3):
+    with app.app_context():
+        for i in range(n):
+            client = Client(nombre=f"Deudor {i}", telefono=str(i))
+            movement = AccountMovement(client=client, amount=100, tipo="fine")
+            db.session.add(movement)
+            for _ in range(pagos_por_movimiento):
+                db.session.add(Payment(client=client, movement=movement, amount=-25))
+        db.session.commit()
+
+
+@pytest.mark.parametrize("query_string", ["", "?payments=0", "?limit=50", "?limit=50&payments=0"])
+@pytest.mark.parametrize(
+    "path, crear",
+    [("/memberships", crear_membresias), ("/account-movements", crear_movimientos)],
+)
+def test_queries_constantes(app, client, url, contar_queries, path, crear, query_string):
+    crear(app, 1)
+    resp, con_uno = contar_queries(lambda: client.get(url(path + query_string)))
+    assert resp.status_code == 200
+
+    crear(app, 20)
+    resp, con_muchos = contar_queries(lambda: client.get(url(path + query_string)))
+    assert resp.status_code == 200
+
+    assert con_uno == con_muchos
+
+
+@pytest.mark.parametrize(
+    "path, crear",
+    [("/memberships", crear_membresias), ("/account-movements", crear_movimientos)],
+)
+def test_payments_0_omite_pagos(app, client, url, path, crear):
+    crear(app, 2)
+    con_pagos = client.get(url(path)).get_json()
+    sin_pagos = client.get(url(path + "?payments=0")).get_json()
+    assert all(len(item["payments"]) == 3 for item in con_pagos)
+    assert all("payments" not in item for item in sin_pagos)
@@ -0,0 +1,32 @@
+"""
+El refresco incremental de rollups no pierde filas estampadas antes de la
+marca anterior pero confirmadas después de leerla (user-018).
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from models import db, DailyPaymentRollup, Payment, RollupState
+from rollups import ROLLUP_NOMBRE, refrescar_rollups
+
+
+def test_pago_confirmado_despues_de_la_marca(app):
+    with app.app_context():
+        refrescar_rollups()
+        marca = db.session.get(RollupState, ROLLUP_NOMBRE).actualizado_hasta
+
+        # Transacción larga: estampó actualizado_en antes de la marca y se
+        # confirmó después de que el refresco anterior leyera
+        pago = Payment(amount=25, fecha_pago=datetime(2026, 3, 2, 10))
+        db.session.add(pago)
+        db.session.commit()
+        db.session.execute(
+            update(Payment)
+            .where(Payment.id == pago.id)
+            .values(actualizado_en=marca - timedelta(minutes=1))
+        )
+        db.session.commit()
+
+        refrescar_rollups()
+        totales = {str(r.dia): float(r.total) for r in DailyPaymentRollup.query}
+        assert totales == {"2026-03-02": 25.0}
@@ -0,0 +1,61 @@
+"""
+Con @versioned, un cambio hecho por otro worker (que solo se ve por
+table_versions) recarga los ReferenceCache antes de armar la respuesta, así
+que el ETag nuevo nunca viaja con nombres viejos (user-023).
+"""
+from sqlalchemy import update
+
+from models import db, CategoriaProducto, MarcaProducto, Producto, TableVersion, Talla, Tienda
+
+
+def test_productos_no_sirve_nombres_viejos_con_etag_nuevo(app, client, url):
+    with app.app_context():
+        db.session.add(Producto(
+            descripcion="Malla",
+            costo=1,
+            precio=2,
+            tienda=Tienda(nombre="Centro"),
+            marca=MarcaProducto(nombre="Marca"),
+            categoria=CategoriaProducto(nombre="Categoría"),
+            talla=Talla(nombre="M"),
+        ))
+        db.session.commit()
+
+    primera = client.get(url("/productos"))
+    assert primera.get_json()[0]["tienda"] == "Centro"
+
+    # Otro worker: escribe directo en la BD (sin pasar por la sesión de
+    # este proceso) e incrementa la versión de la tabla
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(update(Tienda).values(nombre="Norte"))
+        conn.execute(
+            update(TableVersion)
+            .where(TableVersion.tabla == Tienda.__tablename__)
+            .values(version=TableVersion.version + 1)
+        )
+
+    segunda = client.get(url("/productos"), headers={"If-None-Match": primera.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.headers["ETag"] != primera.headers["ETag"]
+    assert segunda.get_json()[0]["tienda"] == "Norte"
+
+
+def test_venta_cambia_el_etag_de_productos(app, client, url):
+    # /productos devuelve cantidad: descontar inventario tiene que invalidarlo
+    with app.app_context():
+        producto = Producto(descripcion="Malla", costo=1, precio=2, cantidad=5, tienda=Tienda(nombre="Centro"))
+        db.session.add(producto)
+        db.session.commit()
+        producto_id = producto.id
+
+    primera = client.get(url("/productos"))
+    venta = client.post(url("/ordenes"), json={
+        "codigo": "V-1",
+        "cliente": {"nombre": "Ana", "telefono": "1"},
+        "items": [{"producto_id": producto_id, "cantidad": 2, "precio_unitario": 2}],
+    })
+    assert venta.status_code == 201
+
+    segunda = client.get(url("/productos"), headers={"If-None-Match": primera.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.get_json()[0]["cantidad"] == 3
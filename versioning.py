@@ -0,0 +1,147 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+from sqlalchemy import event, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+from models import db, TableVersion
+from reference_cache import sync_versions
+
+_modelos = set()
+
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def init_table_versions(app, models):
+    """Registra los modelos cuya versión se incrementa al escribirlos."""
+    _modelos.update(models)
+    app.extensions["table_versions"] = _modelos
+
+
+def _bump(session, tablas):
+    """
+    Incrementa la versión de `tablas` dentro de la transacción que se está
+    confirmando.
+
+    El UPDATE/upsert toma el lock de la fila de table_versions hasta el
+    COMMIT, así que las transacciones que escriben la misma tabla se
+    confirman de a una. Es aceptado a propósito, también para productos,
+    donde cada venta pasa por acá (ajustar_inventario cambia cantidad y
+    /productos la devuelve bajo el mismo ETag):
+    - se corre en before_commit, después del último flush, así que el lock
+      dura solo el upsert y el COMMIT, no la venta completa;
+    - es lo que garantiza que el orden de las versiones sea el de los
+      commits. Un contador sin lock (secuencia, tabla de eventos, max(id))
+      deja que una transacción que confirma tarde quede con una versión ya
+      leída, y el 304 serviría el inventario viejo indefinidamente.
+    Si el POS llegara a esperar en este lock, la salida es sacar cantidad
+    de /productos (servirla aparte, sin @versioned) y no versionar los
+    cambios de inventario; no cambiar el contador.
+    """
+    ahora = datetime.utcnow()
+    upsert = _UPSERTS.get(session.get_bind().dialect.name)
+    for tabla in sorted(tablas):
+        if upsert is not None:
+            stmt = upsert(TableVersion).values(tabla=tabla, version=1, actualizado_en=ahora)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[TableVersion.tabla],
+                set_={"version": TableVersion.version + 1, "actualizado_en": ahora},
+            ))
+            continue
+        result = session.execute(
+            update(TableVersion)
+            .where(TableVersion.tabla == tabla)
+            .values(version=TableVersion.version + 1, actualizado_en=ahora)
+        )
+        if result.rowcount == 0:
+            session.add(TableVersion(tabla=tabla, version=1, actualizado_en=ahora))
+            session.flush()
+
+
+def table_versions(models):
+    """[(tabla, version, actualizado_en)] de los modelos, en una sola consulta."""
+    tablas = sorted(m.__tablename__ for m in models)
+    rows = {
+        row.tabla: row
+        for row in db.session.query(TableVersion).filter(TableVersion.tabla.in_(tablas))
+    }
+    return [
+        (t, rows[t].version, rows[t].actualizado_en) if t in rows else (t, 0, None)
+        for t in tablas
+    ]
+
+
+def versioned(*models):
+    """
+    Decorador para GETs de catálogo: ETag fuerte y Last-Modified a partir de
+    las versiones de `models` (más la ruta y el query string). Si el cliente
+    ya tiene esa versión responde 304 sin ejecutar la vista.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versiones = table_versions(models)
+            # Los nombres que arma la vista salen de los ReferenceCache: que
+            # correspondan a las mismas versiones que el ETag
+            sync_versions(versiones)
+            clave = repr((request.endpoint, request.query_string, versiones))
+            etag = hashlib.sha256(clave.encode("utf-8")).hexdigest()
+            fechas = [v[2] for v in versiones if v[2] is not None]
+            last_modified = max(fechas).replace(microsecond=0) if fechas else None
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                resp = Response(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            # Cada request revalida, pero sin bajar el cuerpo si no cambió
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, "after_flush")
+def _track_version_changes(session, flush_context):
+    if not _modelos:
+        return
+    touched = session.info.setdefault("tablas_modificadas", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if type(obj) in _modelos:
+            touched.add(type(obj).__tablename__)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_changes(orm_execute_state):
+    # UPDATE/DELETE/INSERT masivos (p. ej. el inventario en ajustar_inventario)
+    # no pasan por el flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in _modelos:
+        orm_execute_state.session.info.setdefault("tablas_modificadas", set()).add(
+            mapper.class_.__tablename__
+        )
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_on_commit(session):
+    if not _modelos:
+        return
+    session.flush()
+    tablas = session.info.pop("tablas_modificadas", None)
+    if tablas:
+        _bump(session, tablas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_version_changes(session):
+    session.info.pop("tablas_modificadas", None)